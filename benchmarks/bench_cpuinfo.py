@@ -0,0 +1,115 @@
+"""
+Time looking up the /proc/cpuinfo fields by rescanning the text for each
+one (_get_field_actual) against indexing the first processor block once
+(_index_proc_cpuinfo), on synthetic /proc/cpuinfo text for 1 to 1024
+logical CPUs.
+
+    python benchmarks/bench_cpuinfo.py [runs]
+
+The synthetic text repeats this host's first block, or an x86 sample
+when /proc/cpuinfo can't be read.
+"""
+
+import io
+import os
+import sys
+
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyfetch import cpuinfo
+
+SAMPLE = """processor\t: 0
+vendor_id\t: GenuineIntel
+cpu family\t: 6
+model\t\t: 207
+model name\t: Intel(R) Xeon(R) Processor
+stepping\t: 2
+cpu MHz\t\t: 2100.000
+cache size\t: 16384 KB
+flags\t\t: fpu vme de pse tsc msr pae mce cx8 apic sep mtrr pge mca cmov pat pse36 clflush mmx fxsr sse sse2 ss syscall nx pdpe1gb rdtscp lm constant_tsc rep_good nopl xtopology nonstop_tsc cpuid tsc_known_freq pni pclmulqdq ssse3 fma cx16 pcid sse4_1 sse4_2 x2apic movbe popcnt aes xsave avx f16c rdrand hypervisor lahf_lm abm 3dnowprefetch avx2 avx512f
+bogomips\t: 4200.00
+"""
+
+# The same lookups _get_cpu_info_from_proc_cpuinfo makes
+LOOKUPS = [
+    (False, ("vendor_id", "vendor id", "vendor")),
+    (True, ("model name", "cpu", "processor", "uarch")),
+    (False, ("cache size",)),
+    (False, ("stepping",)),
+    (False, ("model",)),
+    (False, ("cpu family",)),
+    (False, ("Hardware",)),
+    (False, ("flags", "Features", "ASEs implemented")),
+    (False, ("cpu MHz", "cpu speed", "clock", "cpu MHz dynamic", "cpu MHz static")),
+]
+
+CPUS = (1, 16, 64, 256, 1024)
+
+
+def first_block() -> str:
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            block = f.read().split("\n\n")[0]
+    except OSError:
+        return SAMPLE
+
+    return f"{block}\n" if "processor" in block else SAMPLE
+
+
+def synthetic(block: str, cpus: int) -> str:
+    blocks = []
+    for n in range(cpus):
+        lines = block.splitlines()
+        lines[0] = f"processor\t: {n}"
+        blocks.append("\n".join(lines) + "\n")
+
+    return "\n".join(blocks) + "\n"
+
+
+def scan(text: str) -> list:
+    return [cpuinfo._get_field_actual(cant_be_number, text, names) for cant_be_number, names in LOOKUPS]
+
+
+def index(text: str) -> list:
+    fields = cpuinfo._index_proc_cpuinfo(text)
+    return [fields.get(cant_be_number, names) for cant_be_number, names in LOOKUPS]
+
+
+def read(text: str) -> str:
+    # What cat_proc_cpuinfo passes on when the file holds this text
+    cpuinfo.open = lambda path, mode: io.StringIO(text)
+    try:
+        return cpuinfo.DataSource.cat_proc_cpuinfo()[1]
+    finally:
+        del cpuinfo.open
+
+
+def best(probe, text: str, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        probe(text)
+        times.append(perf_counter() - start)
+
+    return min(times)
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    cpuinfo.g_trace = cpuinfo.Trace(False, False)
+    block = first_block()
+
+    print(f"{'cpus':>6} {'size':>8} {'scan':>10} {'index':>10} {'read':>8}")
+    for cpus in CPUS:
+        text = synthetic(block, cpus)
+        if scan(text) != index(text):
+            sys.exit(f"scan and index disagree at {cpus} cpus")
+
+        print(f"{cpus:6} {len(text) / 1024:6.0f} KB {best(scan, text, runs) * 1000:7.2f} ms "
+              f"{best(index, text, runs) * 1000:7.2f} ms {len(read(text)) / 1024:5.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
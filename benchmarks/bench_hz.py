@@ -0,0 +1,66 @@
+"""
+Time the CPUID Hz measurements against the old 1 s sleep: the fast mode
+over several windows, and the Linux cpufreq files.
+
+    python benchmarks/bench_hz.py [runs]
+
+This runs CPUID in this process, so it needs an x86 CPU and memory that
+can be made executable.
+"""
+
+import os
+import sys
+
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyfetch import cpuinfo
+
+WINDOWS = (0.01, 0.02, 0.05)
+
+
+def measure(probe, runs: int) -> tuple:
+    hz = []
+    start = perf_counter()
+    for _ in range(runs):
+        hz.append(probe())
+
+    return hz, (perf_counter() - start) / runs
+
+
+def report(name: str, hz: list, per_call: float, reference: float) -> None:
+    errors = [abs(h - reference) / reference * 100 for h in hz]
+    print(f"{name:8} mean err {sum(errors) / len(errors):7.3f}%  max err {max(errors):7.3f}%  {per_call * 1000:8.2f} ms/call")
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    arch, _ = cpuinfo._parse_arch(cpuinfo.DataSource.arch_string_raw)
+    if arch not in ("X86_32", "X86_64"):
+        sys.exit(f"CPUID needs an x86 CPU, not {cpuinfo.DataSource.arch_string_raw}")
+
+    cpuid = cpuinfo.CPUID()
+    if cpuid.is_selinux_enforcing:
+        sys.exit("SELinux is enforcing, so CPUID can't run here")
+
+    # A few full seconds, as the reference everything else is held to
+    hz, per_call = measure(lambda: cpuid.get_raw_hz("sleep"), 3)
+    reference = sorted(hz)[len(hz) // 2]
+    print(f"sleep    {reference / 1e9:.4f} GHz median of {len(hz)}  {per_call * 1000:8.2f} ms/call")
+
+    for window in WINDOWS:
+        cpuinfo.HZ_FAST_WINDOW = window
+        hz, per_call = measure(lambda: cpuid.get_raw_hz("fast"), runs)
+        report(f"{window * 1000:.0f} ms", hz, per_call, reference)
+
+    if cpuinfo._get_hz_actual_from_sysfs() is None:
+        print("sysfs    skipped, there is no cpufreq here")
+    else:
+        # cpufreq reports the core clock, which can differ from the counter's rate
+        hz, per_call = measure(lambda: float(cpuinfo._get_hz_actual_from_sysfs()), runs)
+        report("sysfs", hz, per_call, reference)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Time finding the GPU name through sysfs and the compiled pci.ids index
+against running lspci, the way get_gpu_info did before.
+
+    python benchmarks/bench_pci.py [runs]
+
+The lspci side is skipped when pciutils isn't installed.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyfetch import pci
+
+
+def sysfs() -> str:
+    devices = pci.display_devices()
+    ids = pci.PciIds.open()
+    return ", ".join(pci.device_name(ids, vendor, device) for vendor, device in devices or [])
+
+
+def lspci() -> str:
+    output = subprocess.run(["lspci"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode()
+    return ", ".join(line.split(": ")[1].split(" (rev")[0] for line in output.splitlines()
+                     if "Display" in line or "3D" in line or "VGA" in line)
+
+
+def bench(name: str, probe, runs: int) -> None:
+    # The first call may build the index, so it isn't timed
+    result = probe()
+
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        probe()
+        times.append(perf_counter() - start)
+
+    times.sort()
+    print(f"{name:6} median {times[len(times) // 2] * 1000:8.3f} ms  min {times[0] * 1000:8.3f} ms  {result or '(none)'}")
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    if pci.display_devices() is None:
+        sys.exit(f"{pci.PCI_DEVICES} can't be read here")
+
+    bench("sysfs", sysfs, runs)
+    if shutil.which("lspci") is None:
+        print("lspci  skipped, pciutils isn't installed")
+    else:
+        bench("lspci", lspci, runs)
+
+
+if __name__ == "__main__":
+    main()
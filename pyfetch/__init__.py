@@ -1 +1 @@
-from .pyfetch import PyFetch
\ No newline at end of file
+from .pyfetch import FIELDS, PyFetch
\ No newline at end of file
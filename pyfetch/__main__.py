@@ -1,15 +1,113 @@
 import argparse
+import sys
 import pyfetch
 
 from pathlib import Path
-from subprocess import getoutput
-from pkg_resources import get_distribution
+from typing import Optional, Tuple
+
+def git_dir() -> Optional[Path]:
+    # The checkout pyfetch itself runs from, not the current directory
+    dot_git = Path(__file__).resolve().parent.parent / '.git'
+    if dot_git.is_dir():
+        return dot_git
+    
+    # Worktrees and submodules have a file pointing at the real directory
+    try:
+        with open(dot_git, 'r') as g:
+            line = g.readline().strip()
+    except OSError:
+        return None
+    
+    if not line.startswith('gitdir: '):
+        return None
+    
+    return dot_git.parent / line[len('gitdir: '):]
+
+def read_ref(common: Path, ref: str) -> Optional[str]:
+    try:
+        with open(common / ref, 'r') as r:
+            return r.read().strip()
+    except OSError:
+        pass
+    
+    # Refs that haven't changed since the last gc only live in packed-refs
+    try:
+        with open(common / 'packed-refs', 'r') as p:
+            for line in p:
+                if line.startswith(('#', '^')):
+                    continue
+                
+                sha, _, name = line.strip().partition(' ')
+                if name == ref:
+                    return sha
+    except OSError:
+        pass
+    
+    return None
+
+def git_head() -> Optional[Tuple[str, str]]:
+    """
+    The branch and short commit hash of the checkout, read from .git
+    without running git. The branch is HEAD when it is detached.
+    """
+    
+    gitdir = git_dir()
+    if gitdir is None:
+        return None
+    
+    try:
+        with open(gitdir / 'HEAD', 'r') as h:
+            head = h.read().strip()
+    except OSError:
+        return None
+    
+    # A worktree keeps its own HEAD, but shares refs with the main checkout
+    common = gitdir
+    try:
+        with open(gitdir / 'commondir', 'r') as c:
+            common = gitdir / c.read().strip()
+    except OSError:
+        pass
+    
+    if not head.startswith('ref: '):
+        return 'HEAD', head[:7]
+    
+    ref = head[len('ref: '):]
+    sha = read_ref(common, ref)
+    if sha is None:
+        return None
+    
+    return ref[len('refs/heads/'):] if ref.startswith('refs/heads/') else ref, sha[:7]
 
 def get_version() -> str:
-    if Path('.git').exists():
-        return f"{get_distribution(__package__).version}-{getoutput('git rev-parse --abbrev-ref HEAD')}-{getoutput('git rev-parse --short HEAD')}"
+    # Much cheaper to import than pkg_resources
+    from importlib.metadata import version
+    
+    head = git_head()
+    if head is not None:
+        return f"{version(__package__)}-{head[0]}-{head[1]}"
     else:
-        return get_distribution(__package__).version
+        return version(__package__)
+
+class VersionAction(argparse.Action):
+    """
+    Like action='version', but only works out the version when asked.
+    """
+    
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, default=argparse.SUPPRESS, help=None) -> None:
+        super().__init__(option_strings=option_strings, dest=dest, default=default, nargs=0, help=help)
+    
+    def __call__(self, parser, namespace, values, option_string=None) -> None:
+        print(f"pyfetch v{get_version()}")
+        parser.exit()
+
+def field_list(value: str) -> list:
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in pyfetch.FIELDS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown field {', '.join(unknown)} (choose from {', '.join(pyfetch.FIELDS)})")
+    
+    return fields
 
 def main(argv=None, in_package=None) -> None:
     if argv is None:
@@ -18,14 +116,53 @@ def main(argv=None, in_package=None) -> None:
     in_package = False if in_package is None else in_package
     
     parser = argparse.ArgumentParser()
-    parser.add_argument('-v', '--version', action='version', version=f'pyfetch v{get_version()}',
+    parser.add_argument('-v', '--version', action=VersionAction,
                         help='show current version and exit')
     parser.add_argument('-l', '--skip-long-commands', action='store_true',
                         help='skips commands that take awhile, removes functionality')
+    parser.add_argument('-r', '--refresh', action='store_true',
+                        help='ignore cached hardware info and collect it again')
+    parser.add_argument('--stats', action='store_true',
+                        help='print cache statistics to stderr')
+    parser.add_argument('-t', '--timeout', type=float, default=5.0,
+                        help='seconds to wait for each field before showing it as unknown')
+    parser.add_argument('-b', '--budget', type=float, metavar='MS',
+                        help='give the whole run MS milliseconds, killing commands that are still running after that')
+    parser.add_argument('-f', '--format', choices=('box', 'json', 'ndjson'), default='box',
+                        help='print the box, one JSON object, or one JSON object per field')
+    parser.add_argument('--fields', type=field_list, metavar='FIELD,...',
+                        help=f"only collect these fields, from {', '.join(pyfetch.FIELDS)}")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--daemon', action='store_true',
+                      help='keep running and answer --client requests over a unix socket')
+    mode.add_argument('--client', action='store_true',
+                      help='ask a running daemon for the output, and collect it here if there is none')
+    mode.add_argument('-w', '--watch', type=float, nargs='?', const=1.0, metavar='INTERVAL',
+                      help='keep running and update memory, uptime and cpu frequency every INTERVAL seconds (default 1)')
     args = parser.parse_args()
     
+    if args.watch is not None and args.format != 'box':
+        parser.error('--watch only draws the box, so it can\'t be used with --format json or ndjson')
+    
+    if args.daemon or args.client:
+        from pyfetch import daemon
+    
+    if args.daemon:
+        daemon.serve(args)
+        return
+    
+    # The daemon keeps its hardware rows, so --refresh has to collect them here
+    if args.client and not args.refresh:
+        output = daemon.request(args)
+        if output is not None:
+            sys.stdout.write(output)
+            return
+    
     pf = pyfetch.PyFetch(in_package, args)
-    pf.main()
+    if args.watch is not None:
+        pf.watch(args.watch)
+    else:
+        pf.main()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+import json
+import os
+import sys
+import threading
+
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+
+def cache_dir() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "pyfetch"
+
+
+def boot_id() -> Optional[str]:
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "r") as b:
+            return b.read().strip()
+    except OSError:
+        pass
+
+    # Darwin and the BSDs have no boot_id, but their boot time changes just as often
+    return boot_time()
+
+
+def boot_time() -> Optional[str]:
+    """
+    The raw kern.boottime timeval, read with sysctlbyname rather than by
+    running sysctl. None where there is no such call.
+    """
+
+    if not sys.platform.startswith(("darwin", "freebsd", "netbsd", "dragonfly")):
+        return None
+
+    import ctypes
+    import ctypes.util
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"))
+        buf = ctypes.create_string_buffer(64)
+        size = ctypes.c_size_t(len(buf))
+        if libc.sysctlbyname(b"kern.boottime", buf, ctypes.byref(size), None, ctypes.c_size_t(0)) != 0:
+            return None
+    except (OSError, AttributeError):
+        return None
+
+    return buf.raw[:size.value].hex()
+
+
+def mtimes(*paths) -> List[Optional[int]]:
+    stamp = []
+    for path in paths:
+        try:
+            stamp.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+
+    return stamp
+
+
+def stats(*paths) -> List[Optional[List[int]]]:
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamp.append([st.st_mtime_ns, st.st_ino, st.st_size])
+        except OSError:
+            stamp.append(None)
+
+    return stamp
+
+
+class Uncached(Exception):
+    """
+    Raised by a cached provider with a value worth showing, but not worth
+    keeping, like the fallback after a failed lookup.
+    """
+
+    def __init__(self, value: Any) -> None:
+        super().__init__(value)
+        self.value = value
+
+
+class Cache:
+    """
+    Values that rarely change, kept on disk together with the stamp they
+    were computed under. A value is reused only while its stamp matches.
+    """
+
+    def __init__(self, name: str, refresh: bool = False) -> None:
+        self.path = cache_dir() / f"{name}.json"
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.hits: List[str] = []
+        self.rebuilds: List[str] = []
+
+        try:
+            with open(self.path, "r") as c:
+                self.entries = json.load(c)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, key: str, stamp: List[Any], compute: Callable[[], Any]) -> Any:
+        # A stamp made only of missing files never changes, so it can't tell
+        # when to compute again, and the value is never kept
+        keep = any(part is not None for part in stamp)
+
+        entry = self.entries.get(key)
+        if keep and not self.refresh and entry is not None and entry["stamp"] == stamp:
+            self.hits.append(key)
+            return entry["value"]
+
+        try:
+            value = compute()
+        except Uncached as e:
+            return e.value
+
+        if value is None or not keep:
+            return value
+
+        with self.lock:
+            self.entries[key] = {"stamp": stamp, "value": value}
+            self.dirty = True
+            self.rebuilds.append(key)
+
+        return value
+
+    def last(self, key: str) -> Any:
+        """
+        The value last stored under key, whatever stamp it was stored with.
+        """
+
+        entry = self.entries.get(key)
+        return entry["value"] if entry is not None else None
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+
+        with self.lock:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+                with open(tmp, "w") as c:
+                    json.dump(self.entries, c)
+                os.replace(tmp, self.path)
+                self.dirty = False
+            except OSError:
+                pass
@@ -0,0 +1,59 @@
+import threading
+
+from time import monotonic
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+class Result:
+    # Like a concurrent.futures.Future, without importing logging for it
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class Collector:
+    """
+    Runs every field provider at once and hands the results back in the
+    order the providers were given, as soon as each one is ready.
+    """
+
+    def __init__(self, providers: Dict[str, Callable[[], str]], timeout: float, fallback: str = "Unknown",
+                 stale: Optional[Dict[str, Callable[[], Optional[str]]]] = None) -> None:
+        self.providers = providers
+        self.timeout = timeout
+        self.fallback = fallback
+        self.stale = stale or {}
+        self.futures: Dict[str, Result] = {}
+
+    def _run(self, future: Result, provider: Callable[[], str]) -> None:
+        try:
+            future.value = provider()
+        except BaseException as e:
+            future.error = e
+        finally:
+            future.done.set()
+
+    def start(self) -> None:
+        # Daemon threads rather than a ThreadPoolExecutor, whose workers are
+        # joined at exit and would let a hung probe hold the process open
+        for name, provider in self.providers.items():
+            future = Result()
+            self.futures[name] = future
+            threading.Thread(target=self._run, args=(future, provider), name=f"pyfetch-{name}", daemon=True).start()
+
+    def results(self) -> Iterator[Tuple[str, str]]:
+        if not self.futures:
+            self.start()
+
+        deadline = monotonic() + self.timeout
+        for name, future in self.futures.items():
+            if future.done.wait(max(0, deadline - monotonic())) and future.error is None:
+                value = future.value
+            else:
+                # An older value is better than none, if there is one
+                value = self.stale[name]() if name in self.stale else None
+                if value is None:
+                    value = self.fallback
+
+            yield name, value
@@ -31,10 +31,35 @@ import os
 import sys
 import platform
 import multiprocessing
+import threading
 import ctypes
 
 CAN_CALL_CPUID_IN_SUBPROCESS = True
 
+# Keep the CPUID process alive between calls, so programs that call
+# get_cpu_info many times only start it once. It is started with
+# forkserver where that is supported.
+REUSE_CPUID_WORKER = False
+
+# Seconds to wait for the CPUID process before killing it
+CPUID_TIMEOUT = 5.0
+
+# Seconds to wait for any other command before killing it
+COMMAND_TIMEOUT = 10.0
+
+# How many sources are queried at once when all fields are wanted,
+# and how many seconds each one gets before its answer is dropped
+BACKEND_WORKERS = 8
+BACKEND_TIMEOUT = 10.0
+
+# How hz_actual is measured when it comes from CPUID:
+# 'sleep' counts time stamp counter ticks over a full second,
+# 'fast' counts them over HZ_FAST_WINDOW seconds,
+# 'sysfs' reads the Linux cpufreq files and falls back to 'fast',
+# 'lazy' does not measure it at all.
+HZ_MODES = ('sleep', 'fast', 'sysfs', 'lazy')
+HZ_FAST_WINDOW = 0.02
+
 g_trace = None
 
 class Trace:
@@ -161,12 +186,16 @@ class Trace:
 		}
 
 class DataSource:
-	bits = platform.architecture()[0]
+	# None of these may run a program, as they are set on import.
+	# platform.architecture runs file, and the processor field of
+	# platform.uname runs uname -p. Only Windows has anything to parse there.
+	bits = '64bit' if sys.maxsize > 2**32 else '32bit'
 	cpu_count = multiprocessing.cpu_count()
 	is_windows = platform.system().lower() == 'windows'
 	arch_string_raw = platform.machine()
-	uname_string_raw = platform.uname()[5]
+	uname_string_raw = platform.uname()[5] if is_windows else arch_string_raw
 	can_cpuid = True
+	cpuid_device = '/dev/cpu/0/cpuid'
 
 	@staticmethod
 	def has_proc_cpuinfo():
@@ -215,6 +244,14 @@ class DataSource:
 	def has_ibm_pa_features():
 		return len(_program_paths('lsprop')) > 0
 
+	@staticmethod
+	def has_cpuid_device():
+		return os.access(DataSource.cpuid_device, os.R_OK)
+
+	@staticmethod
+	def has_sysfs_cpufreq():
+		return os.path.exists('/sys/devices/system/cpu/cpu0/cpufreq')
+
 	@staticmethod
 	def has_wmic():
 		returncode, output = _run_and_get_stdout(['wmic', 'os', 'get', 'Version'])
@@ -222,7 +259,42 @@ class DataSource:
 
 	@staticmethod
 	def cat_proc_cpuinfo():
-		return _run_and_get_stdout(['cat', '/proc/cpuinfo'])
+		g_trace.command_header('Reading file "/proc/cpuinfo" ...')
+
+		# Every processor gets a block, and on x86 the first one has all of
+		# it, flags included, so the kernel isn't asked for the rest. Other
+		# architectures can have a block after them, like Hardware on ARM,
+		# so they are read to the end.
+		lines = []
+		first_block = True
+		has_flags = False
+		try:
+			with open('/proc/cpuinfo', 'r') as f:
+				for line in f:
+					if first_block and not line.strip():
+						if has_flags:
+							break
+						first_block = False
+					elif first_block and line.startswith('flags'):
+						has_flags = True
+					lines.append(line)
+		except (OSError, UnicodeDecodeError):
+			return 1, ''
+
+		output = ''.join(lines)
+		g_trace.command_output('stdout:', output)
+		return 0, output
+
+	@staticmethod
+	def sysfs_cpufreq():
+		# Values are in kHz
+		for name in ['scaling_cur_freq', 'cpuinfo_max_freq']:
+			try:
+				with open('/sys/devices/system/cpu/cpu0/cpufreq/' + name) as f:
+					return f.read().strip()
+			except OSError:
+				pass
+		return None
 
 	@staticmethod
 	def cpufreq_info():
@@ -299,18 +371,23 @@ class DataSource:
 		return feature_bits
 
 
-def _program_paths(program_name):
-	paths = []
-	exts = filter(None, os.environ.get('PATHEXT', '').split(os.pathsep))
-	for p in os.environ['PATH'].split(os.pathsep):
-		p = os.path.join(p, program_name)
-		if os.access(p, os.X_OK):
-			paths.append(p)
-		for e in exts:
-			pext = p + e
-			if os.access(pext, os.X_OK):
-				paths.append(pext)
-	return paths
+try:
+	# Share one index of PATH with the rest of pyfetch
+	from .pathindex import program_paths as _program_paths
+except ImportError:
+	# Running as a script, so look in every directory each time
+	def _program_paths(program_name):
+		paths = []
+		exts = filter(None, os.environ.get('PATHEXT', '').split(os.pathsep))
+		for p in os.environ['PATH'].split(os.pathsep):
+			p = os.path.join(p, program_name)
+			if os.access(p, os.X_OK):
+				paths.append(p)
+			for e in exts:
+				pext = p + e
+				if os.access(pext, os.X_OK):
+					paths.append(pext)
+		return paths
 
 def _run_and_get_stdout(command, pipe_command=None):
 	from subprocess import Popen, PIPE
@@ -326,8 +403,17 @@ def _run_and_get_stdout(command, pipe_command=None):
 		p1 = Popen(pipe_command, stdin=p2.stdout, stdout=PIPE, stderr=PIPE)
 		p2.stdout.close()
 
-	# Get the stdout and stderr
-	stdout_output, stderr_output = p1.communicate()
+	# Get the stdout and stderr, killing the command if it hangs
+	from subprocess import TimeoutExpired
+	try:
+		stdout_output, stderr_output = p1.communicate(timeout=COMMAND_TIMEOUT)
+	except TimeoutExpired:
+		for p in [p1, p2] if pipe_command else [p1]:
+			p.kill()
+			p.wait()
+		g_trace.command_output('timed out after:', str(COMMAND_TIMEOUT))
+		return 1, ''
+
 	stdout_output = stdout_output.decode(encoding='UTF-8')
 	stderr_output = stderr_output.decode(encoding='UTF-8')
 
@@ -369,27 +455,6 @@ def _check_arch():
 		raise Exception("py-cpuinfo currently only works on X86 "
 		                "and some ARM/LoongArch/MIPS/PPC/RISCV/SPARC/S390X CPUs.")
 
-def _obj_to_b64(thing):
-	import pickle
-	import base64
-
-	a = thing
-	b = pickle.dumps(a)
-	c = base64.b64encode(b)
-	d = c.decode('utf8')
-	return d
-
-def _b64_to_obj(thing):
-	import pickle
-	import base64
-
-	try:
-		a = base64.b64decode(thing)
-		b = pickle.loads(a)
-		return b
-	except Exception:
-		return {}
-
 def _utf_to_str(input):
 	if isinstance(input, list):
 		return [_utf_to_str(element) for element in input]
@@ -438,8 +503,68 @@ def _get_field_actual(cant_be_number, raw_string, field_names):
 
 	return None
 
+class _FieldIndex:
+	'''
+	Maps each lower case field name to its non empty values, in line order.
+	Lets _get_field find a field without rescanning the whole output.
+	'''
+
+	def __init__(self, lines):
+		self._fields = {}
+		for line_number, line in enumerate(lines):
+			if ':' in line:
+				left, right = line.split(':', 1)
+				left = left.strip().lower()
+				right = right.strip()
+				if len(right) > 0:
+					self._fields.setdefault(left, []).append((line_number, right))
+
+	def get(self, cant_be_number, field_names):
+		# Same result as _get_field_actual: the first matching line wins
+		found = None
+		for field_name in field_names:
+			for line_number, value in self._fields.get(field_name.lower(), []):
+				if cant_be_number and value.isdigit():
+					continue
+				if found is None or line_number < found[0]:
+					found = (line_number, value)
+				break
+
+		return found[1] if found else None
+
+def _index_fields(raw_string):
+	return _FieldIndex(raw_string.splitlines())
+
+def _index_proc_cpuinfo(raw_string):
+	'''
+	Indexes /proc/cpuinfo from its first block, skipping the later blocks
+	that repeat it for every other processor. Blocks that start with a
+	different field, like the Hardware block at the end on ARM, are kept.
+	'''
+
+	lines = []
+	block_starts = set()
+	start = 0
+	while start < len(raw_string):
+		end = raw_string.find('\n\n', start)
+		if end == -1:
+			end = len(raw_string)
+
+		block = raw_string[start : end].lstrip('\n')
+		block_start = block.split(':', 1)[0].strip().lower()
+		if block_start not in block_starts:
+			block_starts.add(block_start)
+			lines.extend(block.splitlines())
+
+		start = end + 2
+
+	return _FieldIndex(lines)
+
 def _get_field(cant_be_number, raw_string, convert_to, default_value, *field_names):
-	retval = _get_field_actual(cant_be_number, raw_string, field_names)
+	if isinstance(raw_string, _FieldIndex):
+		retval = raw_string.get(cant_be_number, field_names)
+	else:
+		retval = _get_field_actual(cant_be_number, raw_string, field_names)
 
 	# Convert the return value
 	if retval and convert_to:
@@ -1012,43 +1137,148 @@ class CPUID:
 		# Figure out if SE Linux is on and in enforcing mode
 		self.is_selinux_enforcing = _is_selinux_enforcing(trace)
 
+		# The batch function is compiled once, and the registers of every
+		# (leaf, subleaf) it has run are kept
+		self._cpuid_func = None
+		self._registers = {}
+
 	def _asm_func(self, restype=None, argtypes=(), machine_code=[]):
 		asm = ASM(restype, argtypes, machine_code)
 		asm.compile()
 		return asm
 
-	def _run_asm(self, *machine_code):
-		asm = ASM(ctypes.c_uint32, (), machine_code)
-		asm.compile()
-		retval = asm.run()
-		asm.free()
-		return retval
+	def _get_cpuid_batch_func(self):
+		# Takes an array of (leaf, subleaf) uint32 pairs, an array to store
+		# (eax, ebx, ecx, edx) uint32s for each pair, and the pair count.
+		# Runs cpuid for every pair in one call.
+		argtypes = (ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t)
+
+		if DataSource.bits == '32bit':
+			# Works on x86_32 (cdecl)
+			loop = [
+				b"\x8B\x06",          # mov eax,[esi]
+				b"\x8B\x4E\x04",      # mov ecx,[esi+4]
+				b"\x0F\xA2",          # cpuid
+				b"\x89\x07",          # mov [edi],eax
+				b"\x89\x5F\x04",      # mov [edi+4],ebx
+				b"\x89\x4F\x08",      # mov [edi+8],ecx
+				b"\x89\x57\x0C",      # mov [edi+12],edx
+				b"\x83\xC6\x08",      # add esi,8
+				b"\x83\xC7\x10",      # add edi,16
+				b"\x4D",              # dec ebp
+			]
+			loop_size = len(b''.join(loop)) + 2
+			machine_code = [
+				b"\x55",              # push ebp
+				b"\x53",              # push ebx
+				b"\x56",              # push esi
+				b"\x57",              # push edi
+				b"\x8B\x74\x24\x14",  # mov esi,[esp+20]
+				b"\x8B\x7C\x24\x18",  # mov edi,[esp+24]
+				b"\x8B\x6C\x24\x1C",  # mov ebp,[esp+28]
+				b"\x85\xED",          # test ebp,ebp
+				b"\x74" + bytes([loop_size]),        # jz done
+			] + loop + [
+				b"\x75" + bytes([256 - loop_size]),  # jnz loop
+				b"\x5F",              # pop edi
+				b"\x5E",              # pop esi
+				b"\x5B",              # pop ebx
+				b"\x5D",              # pop ebp
+				b"\xC3",              # ret
+			]
+		else:
+			# Works on x86_64, with the pairs in rdi, the output in r9
+			# and the count in r8
+			loop = [
+				b"\x8B\x07",          # mov eax,[rdi]
+				b"\x8B\x4F\x04",      # mov ecx,[rdi+4]
+				b"\x0F\xA2",          # cpuid
+				b"\x41\x89\x01",      # mov [r9],eax
+				b"\x41\x89\x59\x04",  # mov [r9+4],ebx
+				b"\x41\x89\x49\x08",  # mov [r9+8],ecx
+				b"\x41\x89\x51\x0C",  # mov [r9+12],edx
+				b"\x48\x83\xC7\x08",  # add rdi,8
+				b"\x49\x83\xC1\x10",  # add r9,16
+				b"\x49\xFF\xC8",      # dec r8
+			]
+			loop_size = len(b''.join(loop)) + 2
+
+			if DataSource.is_windows:
+				# Microsoft x64 passes rcx, rdx, r8, and rdi is callee saved
+				prologue = [
+					b"\x53",              # push rbx
+					b"\x57",              # push rdi
+					b"\x48\x89\xCF",      # mov rdi,rcx
+					b"\x49\x89\xD1",      # mov r9,rdx
+				]
+				epilogue = [
+					b"\x5F",              # pop rdi
+					b"\x5B",              # pop rbx
+					b"\xC3",              # ret
+				]
+			else:
+				# System V passes rdi, rsi, rdx
+				prologue = [
+					b"\x53",              # push rbx
+					b"\x49\x89\xD0",      # mov r8,rdx
+					b"\x49\x89\xF1",      # mov r9,rsi
+				]
+				epilogue = [
+					b"\x5B",              # pop rbx
+					b"\xC3",              # ret
+				]
+
+			machine_code = prologue + [
+				b"\x4D\x85\xC0",      # test r8,r8
+				b"\x74" + bytes([loop_size]),        # jz done
+			] + loop + [
+				b"\x75" + bytes([256 - loop_size]),  # jnz loop
+			] + epilogue
+
+		return self._asm_func(None, argtypes, machine_code)
+
+	def query(self, *leaves):
+		'''
+		Runs cpuid for each (leaf, subleaf) that has not been run yet, all in
+		one call. Returns the (eax, ebx, ecx, edx) of every one asked for.
+		'''
+
+		missing = [leaf for leaf in dict.fromkeys(leaves) if leaf not in self._registers]
+		if missing:
+			self._registers.update(zip(missing, self._run_cpuid(missing)))
+
+		return [self._registers[leaf] for leaf in leaves]
+
+	def _run_cpuid(self, leaves):
+		if self._cpuid_func is None:
+			self._cpuid_func = self._get_cpuid_batch_func()
+
+		requests = (ctypes.c_uint32 * (2 * len(leaves)))(*[n for leaf in leaves for n in leaf])
+		output = (ctypes.c_uint32 * (4 * len(leaves)))()
+		self._cpuid_func.func(requests, output, len(leaves))
+
+		return [tuple(output[i * 4 : i * 4 + 4]) for i in range(len(leaves))]
+
+	def _cpuid(self, leaf, subleaf=0):
+		return self.query((leaf, subleaf))[0]
+
+	def prefetch(self):
+		'''
+		Runs every leaf the get_ methods read, in two calls.
+		'''
+
+		self.query((0, 0), (1, 0), (7, 0), (0x80000000, 0))
+		max_extension_support = self.get_max_extension_support()
+		self.query(*[(leaf, 0) for leaf in [0x80000001, 0x80000002, 0x80000003, 0x80000004, 0x80000006] if leaf <= max_extension_support])
+
+	def free(self):
+		if self._cpuid_func is not None:
+			self._cpuid_func.free()
+			self._cpuid_func = None
 
 	# http://en.wikipedia.org/wiki/CPUID#EAX.3D0:_Get_vendor_ID
 	def get_vendor_id(self):
-		# EBX
-		ebx = self._run_asm(
-			b"\x31\xC0",        # xor eax,eax
-			b"\x0F\xA2"         # cpuid
-			b"\x89\xD8"         # mov ax,bx
-			b"\xC3"             # ret
-		)
-
-		# ECX
-		ecx = self._run_asm(
-			b"\x31\xC0",        # xor eax,eax
-			b"\x0f\xa2"         # cpuid
-			b"\x89\xC8"         # mov ax,cx
-			b"\xC3"             # ret
-		)
-
-		# EDX
-		edx = self._run_asm(
-			b"\x31\xC0",        # xor eax,eax
-			b"\x0f\xa2"         # cpuid
-			b"\x89\xD0"         # mov ax,dx
-			b"\xC3"             # ret
-		)
+		eax, ebx, ecx, edx = self._cpuid(0)
 
 		# Each 4bits is a ascii letter in the name
 		vendor_id = []
@@ -1061,12 +1291,7 @@ class CPUID:
 
 	# http://en.wikipedia.org/wiki/CPUID#EAX.3D1:_Processor_Info_and_Feature_Bits
 	def get_info(self):
-		# EAX
-		eax = self._run_asm(
-			b"\xB8\x01\x00\x00\x00",   # mov eax,0x1"
-			b"\x0f\xa2"                # cpuid
-			b"\xC3"                    # ret
-		)
+		eax, ebx, ecx, edx = self._cpuid(1)
 
 		# Get the CPU info
 		stepping_id = (eax >> 0) & 0xF # 4 bits
@@ -1095,31 +1320,13 @@ class CPUID:
 	# http://en.wikipedia.org/wiki/CPUID#EAX.3D80000000h:_Get_Highest_Extended_Function_Supported
 	def get_max_extension_support(self):
 		# Check for extension support
-		max_extension_support = self._run_asm(
-			b"\xB8\x00\x00\x00\x80" # mov ax,0x80000000
-			b"\x0f\xa2"             # cpuid
-			b"\xC3"                 # ret
-		)
+		max_extension_support = self._cpuid(0x80000000)[0]
 
 		return max_extension_support
 
 	# http://en.wikipedia.org/wiki/CPUID#EAX.3D1:_Processor_Info_and_Feature_Bits
 	def get_flags(self, max_extension_support):
-		# EDX
-		edx = self._run_asm(
-			b"\xB8\x01\x00\x00\x00",   # mov eax,0x1"
-			b"\x0f\xa2"                # cpuid
-			b"\x89\xD0"                # mov ax,dx
-			b"\xC3"                    # ret
-		)
-
-		# ECX
-		ecx = self._run_asm(
-			b"\xB8\x01\x00\x00\x00",   # mov eax,0x1"
-			b"\x0f\xa2"                # cpuid
-			b"\x89\xC8"                # mov ax,cx
-			b"\xC3"                    # ret
-		)
+		eax, ebx, ecx, edx = self._cpuid(1)
 
 		# Get the CPU flags
 		flags = {
@@ -1195,23 +1402,7 @@ class CPUID:
 
 		# http://en.wikipedia.org/wiki/CPUID#EAX.3D7.2C_ECX.3D0:_Extended_Features
 		if max_extension_support >= 7:
-			# EBX
-			ebx = self._run_asm(
-				b"\x31\xC9",            # xor ecx,ecx
-				b"\xB8\x07\x00\x00\x00" # mov eax,7
-				b"\x0f\xa2"         # cpuid
-				b"\x89\xD8"         # mov ax,bx
-				b"\xC3"             # ret
-			)
-
-			# ECX
-			ecx = self._run_asm(
-				b"\x31\xC9",            # xor ecx,ecx
-				b"\xB8\x07\x00\x00\x00" # mov eax,7
-				b"\x0f\xa2"         # cpuid
-				b"\x89\xC8"         # mov ax,cx
-				b"\xC3"             # ret
-			)
+			eax, ebx, ecx, edx = self._cpuid(7, 0)
 
 			# Get the extended CPU flags
 			extended_flags = {
@@ -1288,21 +1479,7 @@ class CPUID:
 
 		# http://en.wikipedia.org/wiki/CPUID#EAX.3D80000001h:_Extended_Processor_Info_and_Feature_Bits
 		if max_extension_support >= 0x80000001:
-			# EBX
-			ebx = self._run_asm(
-				b"\xB8\x01\x00\x00\x80" # mov ax,0x80000001
-				b"\x0f\xa2"         # cpuid
-				b"\x89\xD8"         # mov ax,bx
-				b"\xC3"             # ret
-			)
-
-			# ECX
-			ecx = self._run_asm(
-				b"\xB8\x01\x00\x00\x80" # mov ax,0x80000001
-				b"\x0f\xa2"         # cpuid
-				b"\x89\xC8"         # mov ax,cx
-				b"\xC3"             # ret
-			)
+			eax, ebx, ecx, edx = self._cpuid(0x80000001)
 
 			# Get the extended CPU flags
 			extended_flags = {
@@ -1386,43 +1563,8 @@ class CPUID:
 
 		# Processor brand string
 		if max_extension_support >= 0x80000004:
-			instructions = [
-				b"\xB8\x02\x00\x00\x80", # mov ax,0x80000002
-				b"\xB8\x03\x00\x00\x80", # mov ax,0x80000003
-				b"\xB8\x04\x00\x00\x80"  # mov ax,0x80000004
-			]
-			for instruction in instructions:
-				# EAX
-				eax = self._run_asm(
-					instruction,  # mov ax,0x8000000?
-					b"\x0f\xa2"   # cpuid
-					b"\x89\xC0"   # mov ax,ax
-					b"\xC3"       # ret
-				)
-
-				# EBX
-				ebx = self._run_asm(
-					instruction,  # mov ax,0x8000000?
-					b"\x0f\xa2"   # cpuid
-					b"\x89\xD8"   # mov ax,bx
-					b"\xC3"       # ret
-				)
-
-				# ECX
-				ecx = self._run_asm(
-					instruction,  # mov ax,0x8000000?
-					b"\x0f\xa2"   # cpuid
-					b"\x89\xC8"   # mov ax,cx
-					b"\xC3"       # ret
-				)
-
-				# EDX
-				edx = self._run_asm(
-					instruction,  # mov ax,0x8000000?
-					b"\x0f\xa2"   # cpuid
-					b"\x89\xD0"   # mov ax,dx
-					b"\xC3"       # ret
-				)
+			for leaf in [0x80000002, 0x80000003, 0x80000004]:
+				eax, ebx, ecx, edx = self._cpuid(leaf)
 
 				# Combine each of the 4 bytes in each register into the string
 				for reg in [eax, ebx, ecx, edx]:
@@ -1442,13 +1584,7 @@ class CPUID:
 		if max_extension_support < 0x80000006:
 			return cache_info
 
-		# ECX
-		ecx = self._run_asm(
-			b"\xB8\x06\x00\x00\x80"  # mov ax,0x80000006
-			b"\x0f\xa2"              # cpuid
-			b"\x89\xC8"              # mov ax,cx
-			b"\xC3"                   # ret
-		)
+		eax, ebx, ecx, edx = self._cpuid(0x80000006)
 
 		cache_info = {
 			'size_b' : (ecx & 0xFF) * 1024,
@@ -1516,21 +1652,83 @@ class CPUID:
 			retval = get_ticks_x86_64
 		return retval
 
-	def get_raw_hz(self):
-		from time import sleep
+	def get_raw_hz(self, mode='sleep'):
+		from time import sleep, perf_counter_ns
 
 		ticks_fn = self.get_ticks_func()
 
-		start = ticks_fn.func()
-		sleep(1)
-		end = ticks_fn.func()
+		if mode == 'sleep':
+			start = ticks_fn.func()
+			sleep(1)
+			end = ticks_fn.func()
+
+			ticks = (end - start)
+		else:
+			# Time each read of the counter, and use the middle of the reads
+			# so the cost of the calls does not skew the short window
+			start_ns = perf_counter_ns()
+			start = ticks_fn.func()
+			start_ns = (start_ns + perf_counter_ns()) // 2
+			sleep(HZ_FAST_WINDOW)
+			end_ns = perf_counter_ns()
+			end = ticks_fn.func()
+			end_ns = (end_ns + perf_counter_ns()) // 2
+
+			ticks = (end - start) * 1000000000 // (end_ns - start_ns)
 
-		ticks = (end - start)
 		ticks_fn.free()
 
 		return ticks
 
-def _get_cpu_info_from_cpuid_actual():
+class CPUIDDevice(CPUID):
+	'''
+	Reads CPUID leaves from the Linux cpuid driver, where the file offset
+	picks the leaf and subleaf. Needs no executable memory, so it can run
+	in this process and under SELinux.
+	'''
+
+	def __init__(self, path):
+		self.is_selinux_enforcing = False
+		self._cpuid_func = None
+		self._registers = {}
+		self._path = path
+
+	def _run_cpuid(self, leaves):
+		import struct
+
+		retval = []
+		fd = os.open(self._path, os.O_RDONLY)
+		try:
+			for leaf, subleaf in leaves:
+				data = os.pread(fd, 16, leaf | (subleaf << 32))
+				if len(data) != 16:
+					raise Exception("Failed to read CPUID leaf {0:#x} from {1}".format(leaf, self._path))
+				retval.append(struct.unpack('<4I', data))
+		finally:
+			os.close(fd)
+
+		return retval
+
+	def get_raw_hz(self, mode='sleep'):
+		# Counting ticks needs rdtsc, which needs executable memory
+		return 0
+
+def _get_hz_actual_from_sysfs():
+	'''
+	Returns the current CPU Hz from the Linux cpufreq files as a decimal string.
+	Returns None if they are not found.
+	'''
+
+	if not DataSource.has_sysfs_cpufreq():
+		return None
+
+	khz = DataSource.sysfs_cpufreq()
+	if not khz or not khz.isdigit():
+		return None
+
+	return _to_decimal_string(int(khz) * 1000)
+
+def _get_cpu_info_from_cpuid_actual(hz_mode='fast'):
 	'''
 	Warning! This function has the potential to crash the Python runtime.
 	Do not call it directly. Use the _get_cpu_info_from_cpuid function instead.
@@ -1561,72 +1759,209 @@ def _get_cpu_info_from_cpuid_actual():
 			trace.fail('SELinux is enforcing. Skipping ...')
 			return trace.to_dict(info, True)
 
-		# Get the cpu info from the CPUID register
-		max_extension_support = cpuid.get_max_extension_support()
-		cache_info = cpuid.get_cache(max_extension_support)
-		info = cpuid.get_info()
+		info = _get_cpu_info_from_cpuid_registers(cpuid, hz_mode)
+		trace.success()
+	except Exception as err:
+		from traceback import format_exc
+		err_string = format_exc()
+		trace._err = ''.join(['\t\t{0}\n'.format(n) for n in err_string.split('\n')]) + '\n'
+		return trace.to_dict(info, True)
+
+	return trace.to_dict(info, False)
 
-		processor_brand = cpuid.get_processor_brand(max_extension_support)
+def _get_cpu_info_from_cpuid_registers(cpuid, hz_mode):
+	'''
+	Returns the CPU info decoded from the leaves of a CPUID object.
+	'''
 
-		# Get the Hz and scale
-		hz_actual = cpuid.get_raw_hz()
+	# Get the cpu info from the CPUID register
+	cpuid.prefetch()
+	max_extension_support = cpuid.get_max_extension_support()
+	cache_info = cpuid.get_cache(max_extension_support)
+	info = cpuid.get_info()
+
+	processor_brand = cpuid.get_processor_brand(max_extension_support)
+
+	# Get the Hz and scale
+	hz_actual = '0.0'
+	if hz_mode == 'sysfs':
+		hz_actual = _get_hz_actual_from_sysfs()
+		if hz_actual is None:
+			hz_mode = 'fast'
+	if hz_mode in ['sleep', 'fast']:
+		hz_actual = cpuid.get_raw_hz(hz_mode)
 		hz_actual = _to_decimal_string(hz_actual)
 
-		# Get the Hz and scale
-		hz_advertised, scale = _parse_cpu_brand_string(processor_brand)
-		info = {
-		'vendor_id_raw' : cpuid.get_vendor_id(),
-		'hardware_raw' : '',
-		'brand_raw' : processor_brand,
+	# Get the Hz and scale
+	hz_advertised, scale = _parse_cpu_brand_string(processor_brand)
+	info = {
+	'vendor_id_raw' : cpuid.get_vendor_id(),
+	'hardware_raw' : '',
+	'brand_raw' : processor_brand,
+
+	'hz_advertised_friendly' : _hz_short_to_friendly(hz_advertised, scale),
+	'hz_actual_friendly' : _hz_short_to_friendly(hz_actual, 0),
+	'hz_advertised' : _hz_short_to_full(hz_advertised, scale),
+	'hz_actual' : _hz_short_to_full(hz_actual, 0),
+
+	'l2_cache_size' : cache_info['size_b'],
+	'l2_cache_line_size' : cache_info['line_size_b'],
+	'l2_cache_associativity' : cache_info['associativity'],
+
+	'stepping' : info['stepping'],
+	'model' : info['model'],
+	'family' : info['family'],
+	'processor_type' : info['processor_type'],
+	'flags' : cpuid.get_flags(max_extension_support)
+	}
+	cpuid.free()
 
-		'hz_advertised_friendly' : _hz_short_to_friendly(hz_advertised, scale),
-		'hz_actual_friendly' : _hz_short_to_friendly(hz_actual, 0),
-		'hz_advertised' : _hz_short_to_full(hz_advertised, scale),
-		'hz_actual' : _hz_short_to_full(hz_actual, 0),
+	return _filter_dict_keys_with_empty_values(info)
 
-		'l2_cache_size' : cache_info['size_b'],
-		'l2_cache_line_size' : cache_info['line_size_b'],
-		'l2_cache_associativity' : cache_info['associativity'],
+def _get_cpu_info_from_cpuid_subprocess_wrapper(conn):
+	import json
 
-		'stepping' : info['stepping'],
-		'model' : info['model'],
-		'family' : info['family'],
-		'processor_type' : info['processor_type'],
-		'flags' : cpuid.get_flags(max_extension_support)
-		}
+	# Answer one request per JSON frame, until a null frame or the pipe closes
+	while True:
+		try:
+			request = json.loads(conn.recv_bytes().decode('utf8'))
+		except EOFError:
+			break
 
-		info = _filter_dict_keys_with_empty_values(info)
-		trace.success()
-	except Exception as err:
-		from traceback import format_exc
-		err_string = format_exc()
-		trace._err = ''.join(['\t\t{0}\n'.format(n) for n in err_string.split('\n')]) + '\n'
-		return trace.to_dict(info, True)
+		if request is None:
+			break
 
-	return trace.to_dict(info, False)
+		orig_stdout = sys.stdout
+		orig_stderr = sys.stderr
+
+		output = _get_cpu_info_from_cpuid_actual(request['hz_mode'])
+
+		sys.stdout = orig_stdout
+		sys.stderr = orig_stderr
+
+		conn.send_bytes(json.dumps(output).encode('utf8'))
+
+class _CPUIDWorker:
+	'''
+	A process that runs CPUID for us, so a crash can't take down this one.
+	'''
+
+	def __init__(self, context):
+		self._conn, child_conn = context.Pipe()
+		self._process = context.Process(target=_get_cpu_info_from_cpuid_subprocess_wrapper, args=(child_conn,))
+		self._process.daemon = True
+		self._process.start()
+
+		# Only the child holds the other end now, so a crash reads as EOF
+		child_conn.close()
+
+	def is_alive(self):
+		return self._process.is_alive()
+
+	def call(self, hz_mode, timeout):
+		'''
+		Returns the output of _get_cpu_info_from_cpuid_actual.
+		Returns None if the process died, or was killed for running past the timeout.
+		'''
 
-def _get_cpu_info_from_cpuid_subprocess_wrapper(queue):
-	orig_stdout = sys.stdout
-	orig_stderr = sys.stderr
+		import json
 
-	output = _get_cpu_info_from_cpuid_actual()
+		try:
+			self._conn.send_bytes(json.dumps({'hz_mode' : hz_mode}).encode('utf8'))
+			if not self._conn.poll(timeout):
+				g_trace.fail('CPUID process timed out. Killing it ...')
+				self.close(kill=True)
+				return None
+
+			output = json.loads(self._conn.recv_bytes().decode('utf8'))
+		except (EOFError, OSError):
+			self.close()
+			return None
+
+		# JSON turns the (value, scale) tuples into lists
+		info = output.get('info') or {}
+		for key in ['hz_advertised', 'hz_actual']:
+			if key in info:
+				info[key] = tuple(info[key])
+
+		return output
+
+	def close(self, kill=False):
+		# A forked child holds a copy of our end too, so it never sees EOF
+		if not kill:
+			try:
+				self._conn.send_bytes(b'null')
+			except OSError:
+				pass
 
-	sys.stdout = orig_stdout
-	sys.stderr = orig_stderr
+		self._conn.close()
+		if kill:
+			self._process.kill()
+		self._process.join(CPUID_TIMEOUT)
+		if self._process.is_alive():
+			self._process.kill()
+			self._process.join()
 
-	queue.put(_obj_to_b64(output))
+g_cpuid_worker = None
 
-def _get_cpu_info_from_cpuid():
+def _get_cpuid_worker():
+	'''
+	Returns a started CPUID worker, reusing the kept one if REUSE_CPUID_WORKER is set.
+	'''
+
+	global g_cpuid_worker
+
+	if not REUSE_CPUID_WORKER:
+		# Fork where it is safe, so the child does not have to start a new interpreter.
+		# A child forked while other threads run can inherit a lock one of them holds,
+		# and macOS stopped forking by default for the same reason.
+		if DataSource.is_windows or sys.platform == 'darwin':
+			method = None
+		elif threading.active_count() == 1:
+			method = 'fork'
+		else:
+			method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+		return _CPUIDWorker(multiprocessing.get_context(method))
+
+	if g_cpuid_worker is None or not g_cpuid_worker.is_alive():
+		methods = multiprocessing.get_all_start_methods()
+		g_cpuid_worker = _CPUIDWorker(multiprocessing.get_context('forkserver' if 'forkserver' in methods else None))
+
+	return g_cpuid_worker
+
+def _get_cpu_info_from_cpuid_device(hz_mode='fast'):
+	'''
+	Returns the CPU info gathered by reading the Linux cpuid driver.
+	Returns {} if the device can't be read.
+	Runs in this process, as reading the device can't crash the runtime.
+	'''
+
+	g_trace.header('Tying to get info from {0} ...'.format(DataSource.cpuid_device))
+
+	# Counting ticks needs executable memory, so only sysfs can give the Hz here
+	if hz_mode != 'lazy':
+		hz_mode = 'sysfs'
+
+	try:
+		info = _get_cpu_info_from_cpuid_registers(CPUIDDevice(DataSource.cpuid_device), hz_mode)
+	except Exception as err:
+		g_trace.fail(err)
+		return {}
+
+	g_trace.success()
+	return info
+
+def _get_cpu_info_from_cpuid(hz_mode='fast'):
 	'''
 	Returns the CPU info gathered by querying the X86 cpuid register in a new process.
 	Returns {} on non X86 cpus.
 	Returns {} if SELinux is in enforcing mode.
+	hz_mode is one of HZ_MODES, and picks how hz_actual is measured.
 	'''
 
 	g_trace.header('Tying to get info from CPUID ...')
 
-	from multiprocessing import Process, Queue
-
 	# Return {} if can't cpuid
 	if not DataSource.can_cpuid:
 		g_trace.fail('Can\'t CPUID. Skipping ...')
@@ -1640,33 +1975,43 @@ def _get_cpu_info_from_cpuid():
 		g_trace.fail('Not running on X86_32 or X86_64. Skipping ...')
 		return {}
 
+	# Use the cpuid driver if there is one, as it needs no new process
+	if DataSource.has_cpuid_device():
+		info = _get_cpu_info_from_cpuid_device(hz_mode)
+		if info and (hz_mode == 'lazy' or 'hz_actual' in info):
+			return info
+
+		# Without cpufreq only counting ticks can give the Hz, and that needs the process
+		if info:
+			measured = _get_cpu_info_from_cpuid_process(hz_mode)
+			for key in ['hz_actual', 'hz_actual_friendly']:
+				if key in measured:
+					info[key] = measured[key]
+			return info
+
+	return _get_cpu_info_from_cpuid_process(hz_mode)
+
+def _get_cpu_info_from_cpuid_process(hz_mode):
+	'''
+	Returns the CPU info gathered by running CPUID in a new process, or in
+	this one when CAN_CALL_CPUID_IN_SUBPROCESS is off.
+	Returns {} if it failed.
+	'''
+
 	try:
 		if CAN_CALL_CPUID_IN_SUBPROCESS:
-			# Start running the function in a subprocess
-			queue = Queue()
-			p = Process(target=_get_cpu_info_from_cpuid_subprocess_wrapper, args=(queue,))
-			p.start()
-
-			# Wait for the process to end, while it is still alive
-			while p.is_alive():
-				p.join(0)
+			# Run the function in a subprocess, and wait for it to answer
+			worker = _get_cpuid_worker()
+			output = worker.call(hz_mode, CPUID_TIMEOUT)
+			if not REUSE_CPUID_WORKER:
+				worker.close()
 
 			# Return {} if it failed
-			if p.exitcode != 0:
+			if output is None:
 				g_trace.fail('Failed to run CPUID in process. Skipping ...')
 				return {}
-
-			# Return {} if no results
-			if queue.empty():
-				g_trace.fail('Failed to get anything from CPUID process. Skipping ...')
-				return {}
 			# Return the result, only if there is something to read
 			else:
-				output = _b64_to_obj(queue.get())
-				import pprint
-				pp = pprint.PrettyPrinter(indent=4)
-				#pp.pprint(output)
-
 				if 'output' in output and output['output']:
 					g_trace.write(output['output'])
 
@@ -1703,7 +2048,7 @@ def _get_cpu_info_from_cpuid():
 			orig_stdout = sys.stdout
 			orig_stderr = sys.stderr
 
-			output = _get_cpu_info_from_cpuid_actual()
+			output = _get_cpu_info_from_cpuid_actual(hz_mode)
 
 			sys.stdout = orig_stdout
 			sys.stderr = orig_stderr
@@ -1735,6 +2080,8 @@ def _get_cpu_info_from_proc_cpuinfo():
 			g_trace.fail('Failed to run cat /proc/cpuinfo. Skipping ...')
 			return {}
 
+		output = _index_proc_cpuinfo(output)
+
 		# Various fields
 		vendor_id = _get_field(False, output, None, '', 'vendor_id', 'vendor id', 'vendor')
 		processor_brand = _get_field(True, output, None, None, 'model name', 'cpu', 'processor', 'uarch')
@@ -1877,6 +2224,8 @@ def _get_cpu_info_from_lscpu():
 			g_trace.fail('Failed to run lscpu. Skipping ...')
 			return {}
 
+		output = _index_fields(output)
+
 		info = {}
 
 		new_hz = _get_field(False, output, None, None, 'CPU max MHz', 'CPU MHz')
@@ -2159,6 +2508,8 @@ def _get_cpu_info_from_sysctl():
 			g_trace.fail('Failed to run \"sysctl machdep.cpu hw.cpufrequency\". Skipping ...')
 			return {}
 
+		output = _index_fields(output)
+
 		# Various fields
 		vendor_id = _get_field(False, output, None, None, 'machdep.cpu.vendor')
 		processor_brand = _get_field(True, output, None, None, 'machdep.cpu.brand_string')
@@ -2651,10 +3002,12 @@ def _get_cpu_info_from_platform_uname():
 		g_trace.fail(err)
 		return {}
 
-def _get_cpu_info_internal():
+def _get_cpu_info_internal(hz_mode='fast', fields=None):
 	'''
 	Returns the CPU info by using the best sources of information for your OS.
 	Returns {} if nothing is found.
+	hz_mode is one of HZ_MODES, and picks how CPUID measures hz_actual.
+	If fields is given, sources are only tried until those keys are found.
 	'''
 
 	g_trace.write('!' * 80)
@@ -2683,63 +3036,119 @@ def _get_cpu_info_internal():
 	g_trace.write("count: {0}".format(info['count']))
 	g_trace.write("arch_string_raw: {0}".format(info['arch_string_raw']))
 
-	# Try the Windows wmic
-	_copy_new_fields(info, _get_cpu_info_from_wmic())
+	# Only measure the Hz if it was asked for
+	if fields is not None and 'hz_actual' not in fields:
+		hz_mode = 'lazy'
 
-	# Try the Windows registry
-	_copy_new_fields(info, _get_cpu_info_from_registry())
+	hz = ['hz_advertised_friendly', 'hz_actual_friendly', 'hz_advertised', 'hz_actual']
+	ids = ['vendor_id_raw', 'brand_raw', 'stepping', 'model', 'family']
+	get_cpuid = lambda: _get_cpu_info_from_cpuid(hz_mode)
+	sources = [
+		# Try the Windows wmic
+		(_get_cpu_info_from_wmic, ids + hz + ['l2_cache_size', 'l3_cache_size']),
 
-	# Try /proc/cpuinfo
-	_copy_new_fields(info, _get_cpu_info_from_proc_cpuinfo())
+		# Try the Windows registry
+		(_get_cpu_info_from_registry, ['vendor_id_raw', 'brand_raw', 'flags'] + hz),
 
-	# Try cpufreq-info
-	_copy_new_fields(info, _get_cpu_info_from_cpufreq_info())
+		# Try /proc/cpuinfo
+		(_get_cpu_info_from_proc_cpuinfo, ids + hz + ['hardware_raw', 'l3_cache_size', 'flags']),
 
-	# Try LSCPU
-	_copy_new_fields(info, _get_cpu_info_from_lscpu())
+		# Try cpufreq-info
+		(_get_cpu_info_from_cpufreq_info, hz),
 
-	# Try sysctl
-	_copy_new_fields(info, _get_cpu_info_from_sysctl())
+		# Try LSCPU
+		(_get_cpu_info_from_lscpu, ids + hz + ['l1_data_cache_size', 'l1_instruction_cache_size', 'l2_cache_size', 'l3_cache_size', 'flags']),
 
-	# Try kstat
-	_copy_new_fields(info, _get_cpu_info_from_kstat())
+		# Try sysctl
+		(_get_cpu_info_from_sysctl, ids + hz + ['l2_cache_size', 'flags']),
 
-	# Try dmesg
-	_copy_new_fields(info, _get_cpu_info_from_dmesg())
+		# Try kstat
+		(_get_cpu_info_from_kstat, ids + hz + ['flags']),
 
-	# Try /var/run/dmesg.boot
-	_copy_new_fields(info, _get_cpu_info_from_cat_var_run_dmesg_boot())
+		# Try dmesg
+		(_get_cpu_info_from_dmesg, ids + hz + ['flags']),
 
-	# Try lsprop ibm,pa-features
-	_copy_new_fields(info, _get_cpu_info_from_ibm_pa_features())
+		# Try /var/run/dmesg.boot
+		(_get_cpu_info_from_cat_var_run_dmesg_boot, ids + hz + ['flags']),
 
-	# Try sysinfo
-	_copy_new_fields(info, _get_cpu_info_from_sysinfo())
+		# Try lsprop ibm,pa-features
+		(_get_cpu_info_from_ibm_pa_features, ['flags']),
 
-	# Try querying the CPU cpuid register
-	# FIXME: This should print stdout and stderr to trace log
-	_copy_new_fields(info, _get_cpu_info_from_cpuid())
+		# Try sysinfo
+		(_get_cpu_info_from_sysinfo, ids + hz + ['l2_cache_size', 'flags']),
+
+		# Try querying the CPU cpuid register
+		# FIXME: This should print stdout and stderr to trace log
+		(get_cpuid, ids + hz + ['hardware_raw', 'l2_cache_size', 'l2_cache_line_size', 'l2_cache_associativity', 'processor_type', 'flags']),
+
+		# Try platform.uname
+		(_get_cpu_info_from_platform_uname, ['family', 'model', 'stepping']),
+	]
+
+	# Query every source at once, but merge them in order, so the result
+	# is the same as asking them one by one. The trace needs them serial.
+	if fields is None and not g_trace._is_active:
+		from concurrent.futures import ThreadPoolExecutor
+		from time import monotonic
+
+		# CPUID may fork, so it runs before the pool starts any threads
+		cpuid_info = get_cpuid()
+
+		pool = ThreadPoolExecutor(max_workers=BACKEND_WORKERS)
+		futures = [None if get_info is get_cpuid else pool.submit(get_info) for get_info, keys in sources]
+		start = monotonic()
+		for future in futures:
+			if future is None:
+				_copy_new_fields(info, cpuid_info)
+				continue
+
+			try:
+				new_info = future.result(timeout=max(0, start + BACKEND_TIMEOUT - monotonic()))
+			except Exception:
+				new_info = {}
+
+			_copy_new_fields(info, new_info)
+
+		# Don't wait on any source that timed out
+		pool.shutdown(wait=False)
+		g_trace.write('!' * 80)
+
+		return info
+
+	for get_info, keys in sources:
+		if fields is not None:
+			# Flags are merged from every source, so they are never done
+			missing = [key for key in fields if key == 'flags' or not info.get(key)]
+			if not missing:
+				break
+			if not any(key in missing for key in keys):
+				continue
 
-	# Try platform.uname
-	_copy_new_fields(info, _get_cpu_info_from_platform_uname())
+		_copy_new_fields(info, get_info())
 
 	g_trace.write('!' * 80)
 
 	return info
 
-def get_cpu_info_json():
+def get_cpu_info_json(in_process=False, hz_mode='fast', fields=None):
 	'''
 	Returns the CPU info by using the best sources of information for your OS.
 	Returns the result in a json string
+	If in_process is True, the info is gathered in the calling process on
+	Linux and macOS instead of in a new Python process. Only the CPUID step
+	still runs in a child process.
+	hz_mode is one of HZ_MODES, and picks how CPUID measures hz_actual.
+	If fields is given, only the sources that can find those keys are tried,
+	and they stop once every key is found. Other keys may still be returned.
 	'''
 
 	import json
 
 	output = None
 
-	# If running under pyinstaller, run normally
-	if getattr(sys, 'frozen', False):
-		info = _get_cpu_info_internal()
+	# If running under pyinstaller, or asked to on a non Windows OS, run normally
+	if getattr(sys, 'frozen', False) or (in_process and not DataSource.is_windows):
+		info = _get_cpu_info_internal(hz_mode, fields)
 		output = json.dumps(info)
 		output = "{0}".format(output)
 	# if not running under pyinstaller, run in another process.
@@ -2748,7 +3157,9 @@ def get_cpu_info_json():
 	else:
 		from subprocess import Popen, PIPE
 
-		command = [sys.executable, __file__, '--json']
+		command = [sys.executable, __file__, '--json', '--hz', hz_mode]
+		if fields is not None:
+			command += ['--fields', ','.join(fields)]
 		p1 = Popen(command, stdout=PIPE, stderr=PIPE, stdin=PIPE)
 		output = p1.communicate()[0]
 
@@ -2759,15 +3170,16 @@ def get_cpu_info_json():
 
 	return output
 
-def get_cpu_info():
+def get_cpu_info(in_process=False, hz_mode='fast', fields=None):
 	'''
 	Returns the CPU info by using the best sources of information for your OS.
 	Returns the result in a dict
+	See get_cpu_info_json for in_process, hz_mode and fields.
 	'''
 
 	import json
 
-	output = get_cpu_info_json()
+	output = get_cpu_info_json(in_process, hz_mode, fields)
 
 	# Convert JSON to Python with non unicode strings
 	output = json.loads(output, object_hook = _utf_to_str)
@@ -2783,6 +3195,8 @@ def main():
 	parser.add_argument('--json', action='store_true', help='Return the info in JSON format')
 	parser.add_argument('--version', action='store_true', help='Return the version of py-cpuinfo')
 	parser.add_argument('--trace', action='store_true', help='Traces code paths used to find CPU info to file')
+	parser.add_argument('--hz', choices=HZ_MODES, default='fast', help='How to measure the actual Hz with CPUID')
+	parser.add_argument('--fields', type=lambda value: value.split(','), help='Comma separated keys to find, skipping sources that are not needed')
 	args = parser.parse_args()
 
 	global g_trace
@@ -2794,7 +3208,7 @@ def main():
 		sys.stderr.write(str(err) + "\n")
 		sys.exit(1)
 
-	info = _get_cpu_info_internal()
+	info = _get_cpu_info_internal(args.hz, args.fields)
 
 	if not info:
 		sys.stderr.write("Failed to find cpu info\n")
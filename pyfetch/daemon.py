@@ -0,0 +1,179 @@
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+from .cache import cache_dir
+from argparse import Namespace
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+# Rows that stay the same for as long as the daemon runs
+STATIC_FIELDS = ("model", "os", "cpu", "gpu")
+
+# The client's session, which the user and shell rows describe
+CLIENT_ENV = ("USER", "SHELL", "BASH_VERSION", "ZSH_VERSION", "FISH_VERSION")
+
+# The client's options, which decide what is collected and how it is printed
+CLIENT_ARGS = ("format", "fields", "budget", "timeout")
+
+
+def socket_path() -> Path:
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return Path(runtime) / "pyfetch.sock"
+
+    return cache_dir() / "pyfetch.sock"
+
+
+def client_env() -> Dict[str, str]:
+    return {name: os.environ[name] for name in CLIENT_ENV if name in os.environ}
+
+
+def connect(path: Path, timeout: float) -> Optional[socket.socket]:
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect(str(path))
+    except OSError:
+        s.close()
+        return None
+
+    return s
+
+
+def request(args: Namespace) -> Optional[str]:
+    """
+    The output a running daemon rendered for this session and options.
+    Returns None if no daemon answered in time, or it can't collect
+    every row that was asked for.
+    """
+
+    s = connect(socket_path(), args.timeout)
+    if s is None:
+        return None
+
+    frame = {"env": client_env(), **{name: getattr(args, name) for name in CLIENT_ARGS}}
+    chunks = []
+    try:
+        with s:
+            s.sendall(json.dumps(frame).encode("utf-8") + b"\n")
+            s.shutdown(socket.SHUT_WR)
+            while True:
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+    except OSError:
+        return None
+
+    return b"".join(chunks).decode("utf-8") or None
+
+
+def memoize(provider: Callable[[], str], kept: Callable[[str], bool]) -> Callable[[], str]:
+    values = []
+
+    def get() -> str:
+        if not values:
+            value = provider()
+            # Failures the cache didn't keep are tried again on the next request
+            if value is None or not kept(value):
+                return value
+            values.append(value)
+
+        return values[0]
+
+    return get
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        from .pyfetch import FIELDS
+
+        try:
+            frame = json.loads(self.rfile.readline())
+            env = frame["env"]
+            args = {name: frame[name] for name in CLIENT_ARGS if name in frame}
+        except (ValueError, KeyError, TypeError):
+            return
+
+        pf = self.server.pf
+        args = Namespace(**{**vars(pf.args), **args})
+
+        # Rows the daemon doesn't collect are left to the client, by answering nothing
+        wanted = args.fields or FIELDS
+        if any(name not in pf.fields for name in wanted):
+            return
+
+        saved = pf.args, pf.fields, pf.runner.timeout
+        pf.args, pf.env, pf.runner.timeout = args, env, args.timeout
+        pf.fields = {name: field for name, field in pf.fields.items() if name in wanted}
+        try:
+            self.wfile.write("".join(f"{line}\n" for line in pf.output()).encode("utf-8"))
+            pf.print_stats()
+        finally:
+            pf.args, pf.fields, pf.runner.timeout = saved
+            pf.env = os.environ
+
+
+def serve(args: Namespace) -> None:
+    """
+    Keep one PyFetch warm and answer --client requests with it. Static
+    rows are collected once, the rest again for every request.
+    """
+
+    from .pyfetch import PyFetch
+
+    path = socket_path()
+    if not hasattr(socket, "AF_UNIX"):
+        sys.exit("pyfetch: unix sockets aren't supported here")
+
+    s = connect(path, args.timeout)
+    if s is not None:
+        s.close()
+        sys.exit(f"pyfetch: a daemon is already listening on {path}")
+
+    # Left behind by a daemon that didn't shut down cleanly
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+    pf = PyFetch(False, args)
+    for name in STATIC_FIELDS:
+        if name not in pf.fields:
+            continue
+
+        icon, color, provider = pf.fields[name]
+        pf.fields[name] = (icon, color, memoize(provider, lambda value, name=name: pf.cache.last(name) == value))
+
+    # Warm up before the first client asks
+    for _ in pf.lines():
+        pass
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    umask = os.umask(0o077)
+    try:
+        server = socketserver.UnixStreamServer(str(path), Handler)
+    finally:
+        os.umask(umask)
+
+    server.pf = pf
+
+    # Let a plain kill remove the socket too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
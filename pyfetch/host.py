@@ -0,0 +1,54 @@
+import os
+
+from typing import Optional, Tuple
+
+SYSTEM_VERSION = "/System/Library/CoreServices/SystemVersion.plist"
+
+# Package managers worth looking for on each system. Anything else gets
+# every one of them, as before.
+PACKAGE_MANAGERS = {
+    "Linux": ("pacman", "rpm", "emerge", "xbps", "dpkg"),
+    "Darwin": ("brew", "port"),
+}
+ALL_PACKAGE_MANAGERS = ("pacman", "rpm", "emerge", "xbps", "dpkg", "brew", "port")
+
+
+class Host:
+    """
+    The system pyfetch runs on, worked out once without running anything:
+    os.uname() everywhere, and SystemVersion.plist on Darwin, which is
+    what sw_vers reads.
+    """
+
+    def __init__(self) -> None:
+        if hasattr(os, "uname"):
+            uname = os.uname()
+            self.system, self.release, self.machine = uname.sysname, uname.release, uname.machine
+        else:
+            import platform
+            self.system, self.release, self.machine = platform.system(), platform.release(), platform.machine()
+
+        self.product_name: Optional[str] = None
+        self.product_version: Optional[str] = None
+        self.build_version: Optional[str] = None
+        if self.system == "Darwin":
+            self.read_system_version()
+
+        self.package_managers: Tuple[str, ...] = PACKAGE_MANAGERS.get(self.system, ALL_PACKAGE_MANAGERS)
+
+    def read_system_version(self) -> None:
+        import plistlib
+
+        try:
+            with open(SYSTEM_VERSION, "rb") as p:
+                version = plistlib.load(p)
+        except (OSError, ValueError):
+            return
+
+        self.product_name = version.get("ProductName")
+        self.product_version = version.get("ProductVersion")
+        self.build_version = version.get("ProductBuildVersion")
+
+    @property
+    def is_ios(self) -> bool:
+        return self.product_name == "iPhone OS"
@@ -0,0 +1,83 @@
+import os
+
+from .pathindex import which
+from pathlib import Path
+from typing import Optional
+
+# Readers that count installed packages straight from each package manager's
+# database. They return None when the database can't be read, so the caller
+# can fall back to asking the package manager itself.
+
+
+def count_dpkg(status: str = "/var/lib/dpkg/status") -> Optional[int]:
+    import re
+
+    try:
+        with open(status, "rb") as s:
+            data = s.read()
+    except OSError:
+        return None
+
+    # Whatever the want flag, so packages on hold ("hi" in dpkg -l) count too
+    return len(re.findall(rb"^Status: \S+ ok installed$", data, re.MULTILINE))
+
+
+def count_rpm() -> Optional[int]:
+    import sqlite3
+
+    for db in ("/usr/lib/sysimage/rpm/rpmdb.sqlite", "/var/lib/rpm/rpmdb.sqlite"):
+        if not os.path.exists(db):
+            continue
+
+        try:
+            con = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+            try:
+                return con.execute("SELECT count(*) FROM Packages").fetchone()[0]
+            finally:
+                con.close()
+        except sqlite3.Error:
+            return None
+
+    # Berkeley DB and ndb databases don't keep a reliable count
+    return None
+
+
+def count_xbps(pkgdb: str = "/var/db/xbps") -> Optional[int]:
+    import plistlib
+
+    try:
+        plists = sorted(Path(pkgdb).glob("pkgdb-*.plist"))
+        if not plists:
+            return None
+
+        with open(plists[-1], "rb") as p:
+            db = plistlib.load(p)
+    except (OSError, ValueError):
+        return None
+
+    # Keys starting with an underscore hold metadata, like _XBPS_ALTERNATIVES_
+    return len([name for name in db if not name.startswith("_")])
+
+
+def brew_cellar() -> Optional[Path]:
+    brew = which("brew")
+    if brew is None:
+        return None
+
+    prefix = Path(brew).parent.parent
+    for directory in (os.environ.get("HOMEBREW_CELLAR"), prefix / "Cellar", prefix / "opt"):
+        if directory is not None and os.path.isdir(directory):
+            return Path(directory)
+
+    return None
+
+
+def count_brew() -> Optional[int]:
+    cellar = brew_cellar()
+    if cellar is None:
+        return None
+
+    try:
+        return len([entry for entry in os.scandir(cellar) if not entry.name.startswith(".")])
+    except OSError:
+        return None
@@ -0,0 +1,61 @@
+import os
+import threading
+
+from typing import FrozenSet, List, Optional, Tuple
+
+# Names in every PATH directory, read once with scandir and kept until
+# PATH or PATHEXT change, so looking up a program costs no syscalls
+# unless it is actually there.
+
+_lock = threading.Lock()
+_key: Optional[Tuple[str, str]] = None
+_dirs: List[Tuple[str, FrozenSet[str]]] = []
+_exts: List[str] = []
+
+
+def _scan(directory: str) -> FrozenSet[str]:
+    # An empty PATH entry means the current directory
+    try:
+        with os.scandir(directory or os.curdir) as entries:
+            return frozenset(os.path.normcase(entry.name) for entry in entries)
+    except OSError:
+        return frozenset()
+
+
+def _index() -> Tuple[List[Tuple[str, FrozenSet[str]]], List[str]]:
+    global _key, _dirs, _exts
+
+    key = (os.environ.get("PATH", ""), os.environ.get("PATHEXT", ""))
+    with _lock:
+        if key != _key:
+            _dirs = [(directory, _scan(directory)) for directory in key[0].split(os.pathsep)]
+            _exts = [ext for ext in key[1].split(os.pathsep) if ext]
+            _key = key
+
+        return _dirs, _exts
+
+
+def program_paths(name: str) -> List[str]:
+    """
+    Every executable called name on PATH, in PATH order, each directory
+    also trying the PATHEXT extensions.
+    """
+
+    dirs, exts = _index()
+
+    paths = []
+    for directory, names in dirs:
+        for candidate in [name] + [name + ext for ext in exts]:
+            if os.path.normcase(candidate) not in names:
+                continue
+
+            path = os.path.join(directory, candidate)
+            if os.access(path, os.X_OK) and not os.path.isdir(path):
+                paths.append(path)
+
+    return paths
+
+
+def which(name: str) -> Optional[str]:
+    paths = program_paths(name)
+    return paths[0] if paths else None
@@ -0,0 +1,200 @@
+import mmap
+import os
+import re
+import struct
+
+from .cache import cache_dir
+from typing import List, Optional, Tuple
+
+PCI_DEVICES = "/sys/bus/pci/devices"
+PCI_IDS = (
+    "/usr/share/hwdata/pci.ids",
+    "/usr/share/misc/pci.ids",
+    "/usr/share/pci.ids",
+    "/usr/share/pciutils/pci.ids",
+    "/usr/local/share/pci.ids",
+    "/usr/local/share/hwdata/pci.ids",
+)
+
+# Class 0x03 is display controllers: VGA, XGA, 3D and other display
+DISPLAY_CLASS = 0x03
+
+# pci.ids vendor lines have no indent, device lines one tab. Subsystem and
+# class lines never match, as they use two tabs or two digit IDs.
+ENTRY_LINE = re.compile(rb"^(\t?)([0-9a-f]{4})  (.*)$", re.M)
+
+# Compiled index layout: header, vendor table, device table, then names.
+# Both tables are sorted by ID, and each vendor points at its own run of
+# devices, so a lookup is two binary searches over the mapped file.
+INDEX_MAGIC = b"PCIX"
+INDEX_VERSION = 1
+HEADER = struct.Struct("<4sIqqII")   # magic, version, source mtime, source size, vendors, devices
+VENDOR = struct.Struct("<HHIII")     # id, name length, name offset, first device, device count
+DEVICE = struct.Struct("<HHI")       # id, name length, name offset
+
+
+def find_pci_ids() -> Optional[str]:
+    for path in PCI_IDS:
+        if os.path.exists(path):
+            return path
+
+    return None
+
+
+def build_index(source: str, st: os.stat_result) -> bytes:
+    with open(source, "rb") as f:
+        data = f.read()
+
+    vendors = []
+    for m in ENTRY_LINE.finditer(data):
+        indent, id, name = m.groups()
+        if not indent:
+            vendors.append((int(id, 16), name.rstrip(), []))
+        elif vendors:
+            vendors[-1][2].append((int(id, 16), name.rstrip()))
+
+    vendors.sort(key=lambda v: v[0])
+    device_count = sum(len(devices) for _, _, devices in vendors)
+
+    names = bytearray()
+    vendor_table = bytearray()
+    device_table = bytearray()
+    first = 0
+    for vendor, vendor_name, devices in vendors:
+        devices.sort(key=lambda d: d[0])
+        vendor_table += VENDOR.pack(vendor, len(vendor_name), len(names), first, len(devices))
+        names += vendor_name
+        for device, device_name in devices:
+            device_table += DEVICE.pack(device, len(device_name), len(names))
+            names += device_name
+        first += len(devices)
+
+    header = HEADER.pack(INDEX_MAGIC, INDEX_VERSION, st.st_mtime_ns, st.st_size, len(vendors), device_count)
+    return header + vendor_table + device_table + names
+
+
+class PciIds:
+    """
+    Vendor and device names from pci.ids, looked up in a compiled index
+    that is kept in the cache directory and memory-mapped.
+    """
+
+    def __init__(self, buf) -> None:
+        self.buf = buf
+        _, _, _, _, self.vendor_count, self.device_count = HEADER.unpack_from(buf, 0)
+        self.vendors_at = HEADER.size
+        self.devices_at = self.vendors_at + self.vendor_count * VENDOR.size
+        self.names_at = self.devices_at + self.device_count * DEVICE.size
+
+    @classmethod
+    def open(cls, path: Optional[str] = None) -> Optional["PciIds"]:
+        source = path or find_pci_ids()
+        if source is None:
+            return None
+
+        try:
+            st = os.stat(source)
+        except OSError:
+            return None
+
+        index = cache_dir() / "pci.ids.idx"
+        try:
+            with open(index, "rb") as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, mtime, size, _, _ = HEADER.unpack_from(buf, 0)
+            if (magic, version, mtime, size) == (INDEX_MAGIC, INDEX_VERSION, st.st_mtime_ns, st.st_size):
+                return cls(buf)
+            buf.close()
+        except (OSError, ValueError, struct.error):
+            pass
+
+        # Missing or built from an older pci.ids
+        try:
+            buf = build_index(source, st)
+        except OSError:
+            return None
+
+        try:
+            index.parent.mkdir(parents=True, exist_ok=True)
+            tmp = index.with_name(f"{index.name}.{os.getpid()}")
+            with open(tmp, "wb") as f:
+                f.write(buf)
+            os.replace(tmp, index)
+        except OSError:
+            pass
+
+        return cls(buf)
+
+    def _name(self, length: int, offset: int) -> str:
+        start = self.names_at + offset
+        return bytes(self.buf[start:start + length]).decode("utf-8", "replace")
+
+    def _search(self, at: int, entry: struct.Struct, lo: int, hi: int, id: int) -> Optional[int]:
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found = struct.unpack_from("<H", self.buf, at + mid * entry.size)[0]
+            if found < id:
+                lo = mid + 1
+            elif found > id:
+                hi = mid
+            else:
+                return mid
+
+        return None
+
+    def lookup(self, vendor: int, device: int) -> Tuple[Optional[str], Optional[str]]:
+        i = self._search(self.vendors_at, VENDOR, 0, self.vendor_count, vendor)
+        if i is None:
+            return None, None
+
+        _, length, offset, first, count = VENDOR.unpack_from(self.buf, self.vendors_at + i * VENDOR.size)
+        vendor_name = self._name(length, offset)
+
+        j = self._search(self.devices_at, DEVICE, first, first + count, device)
+        if j is None:
+            return vendor_name, None
+
+        _, length, offset = DEVICE.unpack_from(self.buf, self.devices_at + j * DEVICE.size)
+        return vendor_name, self._name(length, offset)
+
+
+def _read_hex(path: str) -> int:
+    with open(path, "r") as f:
+        return int(f.read().strip(), 16)
+
+
+def display_devices() -> Optional[List[Tuple[int, int]]]:
+    """
+    Vendor and device IDs of every display controller on the PCI bus.
+    Returns None if sysfs can't be read.
+    """
+
+    try:
+        slots = sorted(os.listdir(PCI_DEVICES))
+    except OSError:
+        return None
+
+    devices = []
+    for slot in slots:
+        path = os.path.join(PCI_DEVICES, slot)
+        try:
+            if _read_hex(os.path.join(path, "class")) >> 16 != DISPLAY_CLASS:
+                continue
+
+            devices.append((_read_hex(os.path.join(path, "vendor")), _read_hex(os.path.join(path, "device"))))
+        except (OSError, ValueError):
+            pass
+
+    return devices
+
+
+def device_name(ids: Optional[PciIds], vendor: int, device: int) -> str:
+    vendor_name, device_name = ids.lookup(vendor, device) if ids is not None else (None, None)
+
+    # Same fallbacks lspci uses for unknown IDs
+    if vendor_name is None:
+        return f"Device {vendor:04x}:{device:04x}"
+    if device_name is None:
+        return f"{vendor_name} Device {device:04x}"
+
+    return f"{vendor_name} {device_name}"
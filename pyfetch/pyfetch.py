@@ -1,24 +1,34 @@
 import os
 import sys
-import psutil
-import subprocess as sp
 
-from .cpuinfo import get_cpu_info
-from platform import machine
-from time import time
-from datetime import datetime
+from .cache import Cache, Uncached, boot_id, mtimes, stats
+from .collector import Collector
+from .host import Host
+from .runner import Runner
+from . import packages as pkgdb
+from . import pci
+from . import sampler
+from .pathindex import which
+from time import monotonic, sleep, time
 from argparse import Namespace
 from pathlib import Path
-from shutil import which
+from glob import glob
 from re import fullmatch, sub
-from requests import get
-from json import loads
+from typing import Callable, Iterator, Optional, Tuple, Union
+
+# Every row, in display order
+FIELDS = ("user", "model", "os", "cpu", "gpu", "packages", "shell", "memory", "uptime")
+
+# Seconds of the budget commands don't get, so a row can still answer
+# with what it has once its command is killed
+KILL_GRACE = 0.05
 
 
 class PyFetch:
     def __init__(self, in_package: bool, args: Namespace) -> None:
         self.in_package = in_package
         self.args = args
+        self.env = os.environ
         
         # Other variables
         self.colors = {
@@ -54,11 +64,59 @@ class PyFetch:
             (1<<10, ' KB'),
             (1, (' byte', ' bytes')),
         ]
-        self.os = sp.getoutput("uname")
+        self.host = Host()
+        self.runner = Runner(args.timeout)
+        self.cached_fields = set()
+        self.os = self.host.system
+        self.cache = Cache("static", args.refresh)
+        self.freq_files = None
+
+        # Rows in display order: name -> (icon, color, provider)
+        self.fields = {
+            "user": ("", "red", self.get_user),
+            "model": ("", "yellow", self.cached("model", self.get_model)),
+            "os": ("", "green", self.cached("os", self.get_os_version)),
+            "cpu": ("", "cyan", self.cached("cpu", self.get_cpu)),
+            "gpu": ("", "blue", self.cached("gpu", self.get_gpu_info)),
+            "packages": ("", "purple", self.get_packages),
+            "shell": ("", "lightred", self.get_shell),
+            "memory": ("", "yellow", self.get_memory_usage),
+            "uptime": ("", "lightgreen", self.get_uptime),
+        }
+        
+        # Rows that weren't asked for are never collected
+        if args.fields:
+            self.fields = {name: field for name, field in self.fields.items() if name in args.fields}
+
+        # Rows that --watch samples again on every tick
+        self.volatile = ("freq", "memory", "uptime")
+
+    def cache_stamp(self, name: str) -> list:
+        kernel = self.host.release
+        if name == "os":
+            return [kernel, *mtimes("/etc/os-release", "/System/Library/CoreServices/SystemVersion.plist")]
+        elif name == "model":
+            return [boot_id(), *mtimes(
+                "/sys/devices/virtual/dmi/id/board_vendor",
+                "/sys/devices/virtual/dmi/id/board_name",
+                "/sys/devices/virtual/dmi/id/product_name",
+                "/sys/devices/virtual/dmi/id/product_version",
+                "/sys/firmware/devicetree/base/model",
+                "/tmp/sysinfo/model"
+            )]
+        else:
+            return [boot_id(), kernel]
+
+    def cached(self, name: str, provider: Callable[[], str]) -> Callable[[], str]:
+        self.cached_fields.add(name)
+        return lambda: self.cache.get(name, self.cache_stamp(name), provider)
+
+    def get_user(self) -> str:
+        return self.env.get('USER')
 
     def get_os_version(self) -> str:
         if self.os == "Darwin":
-            return f"{sp.getoutput('sw_vers -productName')} {sp.getoutput('sw_vers -productVersion')} ({sp.getoutput('sw_vers -buildVersion')})"
+            return f"{self.host.product_name} {self.host.product_version} ({self.host.build_version})"
         elif self.os == "Linux":
             with open("/proc/version", "r") as v:
                 kernel = v.read().split(' ')[2]
@@ -121,19 +179,30 @@ class PyFetch:
                 with open(sysinfo_model, "r") as s:
                     model = s.read()
         elif self.os == "Darwin":
-            prod_name = sp.getoutput('sw_vers -productName')
-            if prod_name == "iPhone OS":
-                machine_id = sp.getoutput('uname -m')
+            if self.host.is_ios:
+                machine_id = self.host.machine
             else:
-                machine_id = sp.getoutput('sysctl -n hw.model')
-                kexts = sp.getoutput("kextstat")
+                machine_id = self.runner.output("sysctl", "-n", "hw.model")
+                kexts = self.runner.output("kextstat")
                 
                 is_hackintosh = True if "FakeSMC" in kexts or "VirtualSMC" in kexts else False
             
-            res = get(f"https://di-api.reincubate.com/v1/apple-identifiers/{machine_id}/")
+            from json import loads
+            from requests import get
+            
+            # Bounded like every command, so a hung lookup can't hold a thread for good
+            timeout = self.args.timeout
+            remaining = self.remaining()
+            if remaining is not None:
+                if remaining <= 0:
+                    raise TimeoutError("no time left to look up the model")
+                timeout = min(timeout, remaining)
+            
+            res = get(f"https://di-api.reincubate.com/v1/apple-identifiers/{machine_id}/", timeout=timeout)
 
+            # Shown this time, but asked again next time
             if res.status_code != 200:
-                return machine_id
+                raise Uncached(machine_id)
 
             j = loads(res.content)
             model = f"{j['product']['sku']}"
@@ -146,43 +215,80 @@ class PyFetch:
         if "Standard PC" in model:
             model = f"{model.strip()} (KVM)"
             
+        model = model.strip()
         if model == "":
-            model = "Unknown"
+            raise Uncached("Unknown")
         
-        return model.strip()
+        return model
     
     def in_path(self, cmd) -> bool:
         return which(cmd) is not None
     
+    def has_manager(self, manager: str, cmd: str) -> bool:
+        # Only look for the ones this system can have
+        return manager in self.host.package_managers and self.in_path(cmd)
+    
     def file_count(self, directory) -> int:
         return len(os.listdir(directory))
     
+    def package_count(self, manager: str, paths: list, direct: Callable[[], Optional[int]], command: Optional[Tuple[str, ...]] = None) -> Union[int, str, None]:
+        def count() -> Optional[int]:
+            l = direct()
+            if l is None and command is not None:
+                l = len(self.runner.output(*command).splitlines())
+            return l
+        
+        try:
+            # Only recount when the package database itself changed
+            if not paths:
+                return count()
+            
+            return self.cache.get(f"packages:{manager}", stats(*paths), count)
+        except TimeoutError:
+            # One slow manager shouldn't cost the others their counts
+            last = self.cache.last(f"packages:{manager}")
+            return last if last is not None else "?"
+    
     def get_packages(self) -> str:
         packages = ""
         
-        if self.in_path("pacman"):
-            packages += f"{', ' if packages != '' else ''}{self.file_count('/var/lib/pacman/local')} pacman"
+        if self.has_manager("pacman", "pacman"):
+            l = self.package_count("pacman", ["/var/lib/pacman/local"], lambda: self.file_count('/var/lib/pacman/local'))
+            packages += f"{', ' if packages != '' else ''}{l} pacman"
         
-        if self.in_path("rpm"):
-            packages += f"{', ' if packages != '' else ''}{len(sp.getoutput('rpm -qa').splitlines())} rpm"
+        if self.has_manager("rpm", "rpm"):
+            l = self.package_count("rpm", [
+                "/usr/lib/sysimage/rpm/rpmdb.sqlite",
+                "/usr/lib/sysimage/rpm/rpmdb.sqlite-wal",
+                "/var/lib/rpm/rpmdb.sqlite",
+                "/var/lib/rpm/rpmdb.sqlite-wal",
+                "/var/lib/rpm/Packages",
+                "/var/lib/rpm/Packages.db"
+            ], pkgdb.count_rpm, ("rpm", "-qa"))
+            packages += f"{', ' if packages != '' else ''}{l} rpm"
         
-        if self.in_path("emerge"):
-            packages += f"{', ' if packages != '' else ''}{self.file_count('/var/db/pkg')} emerge"
+        if self.has_manager("emerge", "emerge"):
+            l = self.package_count("emerge", ["/var/db/pkg"], lambda: self.file_count('/var/db/pkg'))
+            packages += f"{', ' if packages != '' else ''}{l} emerge"
         
-        if self.in_path("xbps-query"):
-            packages += f"{', ' if packages != '' else ''}{len(sp.getoutput('xbps-query -l').splitlines())} xbps"
+        if self.has_manager("xbps", "xbps-query"):
+            l = self.package_count("xbps", ["/var/db/xbps"], pkgdb.count_xbps, ("xbps-query", "-l"))
+            packages += f"{', ' if packages != '' else ''}{l} xbps"
         
-        if self.in_path("dpkg"):
-            l = len(sp.getoutput('dpkg -l').splitlines())
+        if self.has_manager("dpkg", "dpkg"):
+            l = self.package_count("dpkg", ["/var/lib/dpkg/status"], pkgdb.count_dpkg, ("dpkg", "-l"))
             if l != 0:
                 packages += f"{', ' if packages != '' else ''}{l} dpkg"
             
-        if not self.args.skip_long_commands:
-            if self.in_path("brew"):
-                packages += f"{', ' if packages != '' else ''}{len(sp.getoutput('brew leaves').splitlines())} brew"
+        if self.has_manager("brew", "brew"):
+            cellar = pkgdb.brew_cellar()
+            l = self.package_count("brew", [cellar] if cellar else [], pkgdb.count_brew, None if self.args.skip_long_commands else ("brew", "leaves"))
+            if l is not None:
+                packages += f"{', ' if packages != '' else ''}{l} brew"
             
-        if self.in_path("port"):
-            packages += f"{', ' if packages != '' else ''}{len(sp.getoutput('port installed').splitlines())} port"
+        if self.has_manager("port", "port"):
+            l = self.package_count("port", ["/opt/local/var/macports/registry/registry.db"], lambda: None, ("port", "installed"))
+            packages += f"{', ' if packages != '' else ''}{l} port"
         
         if packages == "":
             return "Unknown"
@@ -212,56 +318,153 @@ class PyFetch:
         
     def get_memory_usage(self) -> str:
         mem_str = ""
+        mem = sampler.memory()
+        if mem is None:
+            import psutil
+            mem = psutil.virtual_memory()
         
-        mem_str += f"{self.pretty_size(psutil.virtual_memory()[0] - psutil.virtual_memory()[1])} / " # used ram
-        mem_str += f"{self.pretty_size(psutil.virtual_memory()[0])} " # total ram
-        mem_str += f"({psutil.virtual_memory()[2]}%)" # percentage of ram
+        mem_str += f"{self.pretty_size(mem[0] - mem[1])} / " # used ram
+        mem_str += f"{self.pretty_size(mem[0])} " # total ram
+        mem_str += f"({mem[2]}%)" # percentage of ram
         
         return mem_str
     
+    def remaining(self) -> Optional[float]:
+        # Seconds left of --budget, or None without one
+        if self.runner.deadline is None:
+            return None
+        
+        return max(0, self.runner.deadline - monotonic())
+    
+    def get_cpu(self) -> str:
+        from . import cpuinfo
+        
+        # Hold cpuinfo's own commands to the budget too
+        timeouts = cpuinfo.COMMAND_TIMEOUT, cpuinfo.CPUID_TIMEOUT
+        remaining = self.remaining()
+        if remaining is not None:
+            cpuinfo.COMMAND_TIMEOUT, cpuinfo.CPUID_TIMEOUT = (min(timeout, remaining) for timeout in timeouts)
+        
+        try:
+            return f"{cpuinfo.get_cpu_info(in_process=True, fields=['brand_raw'])['brand_raw']} ({self.host.machine})"
+        finally:
+            cpuinfo.COMMAND_TIMEOUT, cpuinfo.CPUID_TIMEOUT = timeouts
+    
+    def core_frequencies(self) -> list:
+        # Kept open, as --watch reads them again on every tick
+        if self.freq_files is None:
+            self.freq_files = []
+            for path in sorted(glob("/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_cur_freq")):
+                try:
+                    self.freq_files.append(open(path, "rb", buffering=0))
+                except OSError:
+                    pass
+        
+        mhz = []
+        for f in self.freq_files:
+            try:
+                f.seek(0)
+                mhz.append(int(f.read()) / 1000)
+            except (OSError, ValueError):
+                pass
+        
+        if not mhz and self.os == "Linux":
+            # No cpufreq driver, as in most VMs
+            with open("/proc/cpuinfo", "r") as c:
+                mhz = [float(line.split(":")[1]) for line in c if line.startswith("cpu MHz")]
+        elif not mhz:
+            import psutil
+            
+            freq = psutil.cpu_freq()
+            mhz = [freq.current] if freq else []
+        
+        return mhz
+    
+    def get_cpu_frequency(self) -> str:
+        mhz = self.core_frequencies()
+        if not mhz:
+            return "Unknown"
+        
+        average = f"{sum(mhz) / len(mhz) / 1000:.2f} GHz"
+        if min(mhz) == max(mhz):
+            return average
+        
+        return f"{average} ({min(mhz) / 1000:.2f} - {max(mhz) / 1000:.2f} GHz over {len(mhz)} cores)"
+    
     def get_uptime(self) -> str:
-        uptime = datetime.now() - datetime.fromtimestamp(psutil.boot_time())
-        return str(uptime).split(".")[0]
+        uptime = sampler.uptime()
+        if uptime is None:
+            import psutil
+            uptime = time() - psutil.boot_time()
+        
+        # Same as str(timedelta) without the fraction, "1 day, 2:03:04"
+        minutes, seconds = divmod(int(uptime), 60)
+        hours, minutes = divmod(minutes, 60)
+        days, hours = divmod(hours, 24)
+        clock = f"{hours}:{minutes:02}:{seconds:02}"
+        
+        if days:
+            return f"{days} day{'s' if days != 1 else ''}, {clock}"
+        
+        return clock
 
     def get_gpu_info(self) -> str:
         if self.os == "Darwin":
-            prod_name = sp.getoutput('sw_vers -productName')
-            if prod_name == "iPhone OS":
+            if self.host.is_ios:
                 pass
             else:
-                gpu_info = sp.getoutput("system_profiler SPDisplaysDataType")
+                gpu_info = self.runner.output("system_profiler", "SPDisplaysDataType")
                 l = gpu_info.splitlines()
                 for line in l:
                     if "Chipset Model:" in line:
                         gpu = line.split("Chipset Model: ")[1]
         else:
-            lspci = sp.getoutput("lspci")
-            l = lspci.splitlines()
-            for line in l:
-                if "Display" in line or "3D" in line or "VGA" in line:
-                    gpu = line.split(": ")[1].split(" (rev")[0]
+            devices = pci.display_devices()
+            if devices is not None:
+                if devices:
+                    ids = pci.PciIds.open()
+                    gpu = ", ".join(pci.device_name(ids, vendor, device) for vendor, device in devices)
+            else:
+                lspci = self.runner.output("lspci")
+                l = lspci.splitlines()
+                for line in l:
+                    if "Display" in line or "3D" in line or "VGA" in line:
+                        gpu = line.split(": ")[1].split(" (rev")[0]
         
         try:
             if "Intel" in gpu:
-                gpu = gpu.replace("Corporation ", "")
+                gpu = gpu.replace("Intel Corporation ", "Intel ")
             
             return gpu
         except:
-            return "Unknown"
+            raise Uncached("Unknown")
+
+    def shell_version(self, shell: str, shell_clean: str) -> str:
+        if shell_clean == "bash":
+            bash_version = self.runner.output(shell, "--version")
+            return bash_version.splitlines()[0].split("version ")[1].split(" (")[0]
+        elif shell_clean == "zsh":
+            return self.runner.output(shell, "--version").split(" (")[0]
+        elif shell_clean == "fish":
+            # "fish, version 3.6.0", so it reads the same as $FISH_VERSION
+            return self.runner.output(shell, "--version").split("version ")[-1]
+        else:
+            return self.runner.output(shell, "--version")
 
     def get_shell(self) -> str:
-        shell = os.environ.get('SHELL')
+        shell = self.env.get('SHELL')
         shell_clean = shell.split("/")[-1]
         
         try:
             if not shell_clean in ("sh", "ash", "dash", "es"):
-                if shell_clean == "bash":
-                    bash_version = sp.getoutput(f"{shell} --version")
-                    version = bash_version.splitlines()[0].split("version ")[1].split(" (")[0]
-                elif shell_clean == "zsh":
-                    version = sp.getoutput(f"{shell} --version").split(" (")[0]
-                else:
-                    version = sp.getoutput(f"{shell} --version")
+                # Set by the shell itself, when it exported them
+                version = None
+                if shell_clean in ("bash", "zsh", "fish"):
+                    version = self.env.get(f"{shell_clean.upper()}_VERSION")
+                
+                # Otherwise only run the shell again once it has been upgraded
+                if not version:
+                    version = self.cache.get(f"shell:{shell}", stats(shell), lambda: self.shell_version(shell, shell_clean))
             
             if shell_clean in version:
                 return version
@@ -273,18 +476,115 @@ class PyFetch:
     def add_item(self, icon: str, name: str, content: str, color: str) -> str:
         return f"│ {self.colors[color]}{icon} {self.colors['reset']}{name.ljust(9)}│ {self.colors[color]}{content}{self.colors['reset']}"
 
+    def colors_item(self) -> str:
+        return self.add_item("", "colors", f"{self.colors['black']}● {self.colors['red']}● {self.colors['yellow']}● {self.colors['green']}● {self.colors['cyan']}● {self.colors['blue']}● {self.colors['purple']}● {self.colors['reset']}●", "reset")
+
+    def results(self) -> Iterator[Tuple[str, str]]:
+        # Every row, and every command they run, shares what is left of the budget
+        timeout = self.args.timeout
+        deadline = None
+        if self.args.budget is not None:
+            timeout = min(timeout, self.args.budget / 1000)
+            deadline = monotonic() + timeout - min(KILL_GRACE, timeout / 10)
+        
+        self.runner.clear(deadline)
+        stale = {name: (lambda name=name: self.cache.last(name)) for name in self.cached_fields}
+        collector = Collector({name: provider for name, (_, _, provider) in self.fields.items()}, timeout, stale=stale)
+        
+        yield from collector.results()
+        # Rows that gave up on a command don't leave it running
+        self.runner.kill_running()
+        self.cache.save()
+    
+    def print_stats(self) -> None:
+        # Only once the output is complete, so it doesn't land inside the box
+        if not self.args.stats:
+            return
+        
+        print(f"cache {self.cache.path}: {len(self.cache.hits)} hits ({', '.join(self.cache.hits)}), "
+              f"{len(self.cache.rebuilds)} rebuilt ({', '.join(self.cache.rebuilds)})", file=sys.stderr)
+        print(f"commands: {len(self.runner.spawns)} run ({', '.join(self.runner.spawns)}), "
+              f"{self.runner.reused} reused", file=sys.stderr)
+
+    def lines(self) -> Iterator[str]:
+        yield "╭────────────╮"
+        for name, value in self.results():
+            icon, color, _ = self.fields[name]
+            yield self.add_item(icon, name, value, color)
+        yield "├────────────┤"
+        yield self.colors_item()
+        yield "╰────────────╯"
+
+    def output(self) -> Iterator[str]:
+        from json import dumps
+        
+        if self.args.format == "json":
+            yield dumps(dict(self.results()))
+        elif self.args.format == "ndjson":
+            # One object per row, as soon as it is ready
+            for name, value in self.results():
+                yield dumps({"field": name, "value": value})
+        else:
+            yield from self.lines()
+    
     def main(self) -> None:
-        print("╭────────────╮")
-        print(self.add_item("", "user", os.environ.get('USER'), "red"))
-        print(self.add_item("", "model", self.get_model(), "yellow"))
-        print(self.add_item("", "os", self.get_os_version(), "green"))
-        print(self.add_item("", "cpu", f"{get_cpu_info()['brand_raw']} ({machine()})", "cyan"))
-        print(self.add_item("", "gpu", self.get_gpu_info(), "blue"))
-        print(self.add_item("", "packages", self.get_packages(), "purple"))
-        print(self.add_item("", "shell", self.get_shell(), "lightred"))
-        print(self.add_item("", "memory", self.get_memory_usage(), "yellow"))
-        print(self.add_item("", "uptime", self.get_uptime(), "lightgreen"))
-        print("├────────────┤")
-        print(self.add_item("", "colors", f"{self.colors['black']}● {self.colors['red']}● {self.colors['yellow']}● {self.colors['green']}● {self.colors['cyan']}● {self.colors['blue']}● {self.colors['purple']}● {self.colors['reset']}●", "reset"))
-        print("╰────────────╯")
-            
\ No newline at end of file
+        for line in self.output():
+            print(line, flush=True)
+        self.print_stats()
+
+    def watch(self, interval: float) -> None:
+        # Per-core frequency only makes sense while watching
+        fields = {}
+        for name, field in self.fields.items():
+            fields[name] = field
+            if name == "cpu":
+                fields["freq"] = ("", "cyan", self.get_cpu_frequency)
+        
+        # Everything is collected once, only volatile rows again after that
+        collector = Collector({name: provider for name, (_, _, provider) in fields.items()}, self.args.timeout)
+        values = dict(collector.results())
+        self.cache.save()
+        
+        rows = list(fields)
+        out = sys.stdout
+        out.write("\033[?25l") # hide the cursor
+        out.write("╭────────────╮\n")
+        for name in rows:
+            icon, color, _ = fields[name]
+            out.write(f"{self.add_item(icon, name, values[name], color)}\n")
+        out.write(f"├────────────┤\n{self.colors_item()}\n╰────────────╯\n")
+        out.flush()
+        
+        try:
+            tick = monotonic()
+            while True:
+                tick += interval
+                sleep(max(0, tick - monotonic()))
+                
+                redraw = ""
+                for name in self.volatile:
+                    if name not in fields:
+                        continue
+                    
+                    icon, color, provider = fields[name]
+                    try:
+                        value = provider()
+                    except Exception:
+                        value = "Unknown"
+                    
+                    if value == values[name]:
+                        continue
+                    values[name] = value
+                    
+                    # The cursor sits below the box, so count up to the row and back
+                    up = len(rows) + 3 - rows.index(name)
+                    redraw += f"\033[{up}A\r{self.add_item(icon, name, value, color)}\033[K\033[{up}B\r"
+                
+                if redraw:
+                    out.write(redraw)
+                    out.flush()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            out.write("\033[?25h") # show the cursor again
+            out.flush()
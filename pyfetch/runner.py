@@ -0,0 +1,126 @@
+import os
+import signal
+import subprocess
+import threading
+
+from .collector import Result
+from .pathindex import which
+from time import monotonic
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class Runner:
+    """
+    Runs external commands without a shell, each distinct command at
+    most once per run, and keeps count of what was actually started.
+
+    Each command gets a session of its own, so an overrun can be killed
+    together with anything it started. That rules out posix_spawn, so
+    subprocess forks and execs every command.
+    """
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self.deadline: Optional[float] = None
+        self.lock = threading.Lock()
+        self.results: Dict[Tuple[str, ...], Result] = {}
+        self.spawns: List[str] = []
+        self.reused = 0
+        self.running: Set[subprocess.Popen] = set()
+
+    def clear(self, deadline: Optional[float] = None) -> None:
+        with self.lock:
+            self.deadline = deadline
+            self.results = {}
+            self.spawns = []
+            self.reused = 0
+
+    def kill(self, p: subprocess.Popen) -> None:
+        # The whole session, so nothing the command started outlives it
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(p.pid, signal.SIGKILL)
+            else:
+                p.kill()
+        except OSError:
+            pass
+
+    def kill_running(self) -> None:
+        """
+        Kill every command that is still running, once nobody is left
+        waiting for its output.
+        """
+
+        with self.lock:
+            running = list(self.running)
+
+        for p in running:
+            self.kill(p)
+
+    def run(self, argv: Tuple[str, ...]) -> str:
+        # Looked up here, so a missing program costs no fork
+        program = which(argv[0]) if "/" not in argv[0] else argv[0]
+        if program is None:
+            return ""
+
+        # Whatever is left of the run's budget, if that is less
+        timeout = self.timeout
+        if self.deadline is not None:
+            timeout = min(timeout, self.deadline - monotonic())
+            if timeout <= 0:
+                raise TimeoutError(f"no time left to run {argv[0]}")
+
+        self.spawns.append(argv[0])
+        try:
+            p = subprocess.Popen((program, *argv[1:]), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, start_new_session=True)
+        except OSError:
+            return ""
+
+        with self.lock:
+            self.running.add(p)
+        try:
+            stdout, _ = p.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.kill(p)
+            p.communicate()
+            raise TimeoutError(f"{argv[0]} ran past {timeout:.2f}s")
+        finally:
+            with self.lock:
+                self.running.discard(p)
+
+        # Same as subprocess.getoutput
+        output = stdout.decode("utf-8", "replace")
+        return output[:-1] if output.endswith("\n") else output
+
+    def output(self, *argv: str) -> str:
+        """
+        stdout and stderr of argv, like subprocess.getoutput. Returns ""
+        if the program isn't there, and raises TimeoutError if it was
+        killed for running past the timeout or the run's budget.
+        """
+
+        with self.lock:
+            result = self.results.get(argv)
+            owner = result is None
+            if owner:
+                result = self.results[argv] = Result()
+            else:
+                self.reused += 1
+
+        # Someone else is already running it, so wait for their output
+        if not owner:
+            result.done.wait()
+            if result.error is not None:
+                raise result.error
+            return result.value
+
+        try:
+            result.value = self.run(argv)
+        except BaseException as e:
+            result.error = e
+            raise
+        finally:
+            result.done.set()
+
+        return result.value
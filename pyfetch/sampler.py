@@ -0,0 +1,52 @@
+import time
+
+from typing import Optional, Tuple
+
+# Volatile readings straight from /proc, so Linux never needs psutil for
+# them. Each returns None when it can't be read, and the caller falls
+# back to psutil.
+
+
+def memory() -> Optional[Tuple[int, int, float]]:
+    """
+    Total bytes, available bytes and percent used, in the same order as
+    psutil.virtual_memory(), all from one read of /proc/meminfo.
+    """
+
+    try:
+        with open("/proc/meminfo", "rb") as m:
+            data = m.read()
+    except OSError:
+        return None
+
+    fields = {}
+    for line in data.splitlines():
+        name, _, value = line.partition(b":")
+        fields[name] = value
+
+    # Kernels before 3.14 don't have MemAvailable, and psutil estimates it
+    try:
+        total = int(fields[b"MemTotal"].split()[0]) * 1024
+        available = int(fields[b"MemAvailable"].split()[0]) * 1024
+    except (KeyError, IndexError, ValueError):
+        return None
+
+    if not total:
+        return None
+
+    return total, available, round((total - available) / total * 100, 1)
+
+
+def uptime() -> Optional[float]:
+    # CLOCK_BOOTTIME keeps counting while suspended, like /proc/uptime
+    if hasattr(time, "CLOCK_BOOTTIME"):
+        try:
+            return time.clock_gettime(time.CLOCK_BOOTTIME)
+        except OSError:
+            pass
+
+    try:
+        with open("/proc/uptime", "r") as u:
+            return float(u.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
@@ -0,0 +1,59 @@
+import json
+import os
+import struct
+
+from pathlib import Path
+
+from pyfetch import cpuinfo
+
+# Leaves captured from /dev/cpu/0/cpuid on an Intel Xeon VM
+LEAVES = json.loads((Path(__file__).parent / "fixtures" / "cpuid_leaves.json").read_text())
+
+# Offsets the driver reads each leaf at, as leaf | subleaf << 32
+OFFSETS = sorted(int(leaf, 16) for leaf in LEAVES)
+
+
+def make_device(tmp_path, monkeypatch) -> None:
+    # The driver answers every offset with that leaf's 16 bytes, which a
+    # plain file can't do, so the leaves are packed in order and reads
+    # mapped to their place
+    device = tmp_path / "cpuid"
+    with open(device, "wb") as d:
+        for offset in OFFSETS:
+            d.write(struct.pack("<4I", *LEAVES[f"{offset:#010x}"]))
+
+    pread = os.pread
+
+    def fake_pread(fd, length, offset):
+        assert offset in OFFSETS, f"read at {offset:#x}, which holds no captured leaf"
+        return pread(fd, length, OFFSETS.index(offset) * 16)
+
+    monkeypatch.setattr(os, "pread", fake_pread)
+    monkeypatch.setattr(cpuinfo.DataSource, "cpuid_device", str(device))
+
+
+def test_device_leaves(tmp_path, monkeypatch):
+    make_device(tmp_path, monkeypatch)
+
+    info = cpuinfo._get_cpu_info_from_cpuid_device("lazy")
+    assert info["vendor_id_raw"] == "GenuineIntel"
+    assert info["brand_raw"] == "Intel(R) Xeon(R) Processor"
+    assert (info["family"], info["model"], info["stepping"]) == (6, 207, 2)
+    assert {"sse4_2", "avx2", "avx512f"} <= set(info["flags"])
+    assert "hz_actual" not in info
+
+
+def test_device_hz_without_cpufreq(tmp_path, monkeypatch):
+    make_device(tmp_path, monkeypatch)
+    monkeypatch.setattr(cpuinfo.DataSource, "arch_string_raw", "x86_64")
+    monkeypatch.setattr(cpuinfo.DataSource, "can_cpuid", True)
+    monkeypatch.setattr(cpuinfo.DataSource, "has_sysfs_cpufreq", staticmethod(lambda: False))
+
+    # Stands in for counting ticks in the CPUID process
+    measured = {"hz_actual": (2100000000, 0), "hz_actual_friendly": "2.1000 GHz", "brand_raw": "elsewhere"}
+    monkeypatch.setattr(cpuinfo, "_get_cpu_info_from_cpuid_process", lambda hz_mode: measured)
+
+    info = cpuinfo._get_cpu_info_from_cpuid("fast")
+    assert info["hz_actual"] == (2100000000, 0)
+    assert info["hz_actual_friendly"] == "2.1000 GHz"
+    assert info["brand_raw"] == "Intel(R) Xeon(R) Processor"
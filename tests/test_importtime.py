@@ -0,0 +1,44 @@
+import subprocess
+import sys
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Start-up budget for importing the entry point, in milliseconds. The
+# target is a cold start under 20 ms, with a little room for noise.
+BUDGET_MS = 25
+
+# Only the providers that need them may import these
+DEFERRED = ("psutil", "requests", "datetime", "pkg_resources", "pyfetch.cpuinfo")
+
+
+def import_times() -> dict:
+    """
+    Cumulative microseconds per module, from python -X importtime.
+    """
+
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", "import pyfetch.__main__"],
+                       cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+
+    times = {}
+    for line in p.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+
+    return times
+
+
+def test_deferred_imports():
+    imported = import_times()
+    assert [name for name in DEFERRED if name in imported] == []
+
+
+def test_startup_budget():
+    # Best of three, so a busy machine doesn't fail it
+    best = min(import_times()["pyfetch.__main__"] for _ in range(3))
+    assert best / 1000 < BUDGET_MS